@@ -1,11 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from uuid import uuid4
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+import json
 import os
+import queue
+import shutil
 
 # local module
-from base64_processing import match_extracted_with_template
+from async_runtime import event_loop
+from base64_processing import build_image_profile
+from pipeline import arun_pipeline, run_batch, run_pipeline, PIPELINES, DEFAULT_BACKEND
+from job_queue import job_queue, read_submission, QueueFullError
+from llm_scheduler import gemini_scheduler, openai_scheduler, priority_lane, INTERACTIVE, LANES
+from extraction_cache import extraction_cache
+from metrics import current_trace, registry, span, tracing, UPLOAD_SAVE
+from storage import disk_usage, storage_sweeper, store_upload
+from text_layer import EXTRACTION_MODE, EXTRACTION_MODES
+from upload_validation import (check_upload_head, validate_document, InvalidUploadError, EXTENSION_TYPES,
+                               MAX_UPLOAD_MB, SNIFF_BYTES)
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +31,13 @@ app.secret_key = os.getenv("SECRET_KEY", "default_secret_key")
 
 # Upload configurations
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = set(EXTENSION_TYPES)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Larger requests are refused with a 413 while the body is being read, before anything is stored.
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+# Seconds between keep-alive comments on streaming responses, below typical proxy idle timeouts
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -28,6 +48,116 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def request_value(name, default=None):
+    return request.args.get(name, request.form.get(name, default))
+
+
+def request_flag(name):
+    return request_value(name, '').lower() in {'1', 'true', 'yes'}
+
+
+def request_image_profile():
+    return build_image_profile(**{
+        key: request_value(f'image_{key}')
+        for key in ('format', 'quality', 'grayscale', 'max_edge', 'dpi')
+    })
+
+
+def request_processing_options():
+    """Read the per-request extraction options, raising ValueError when one is invalid."""
+    mode = request_value('mode', EXTRACTION_MODE).lower()
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Invalid mode, expected one of {sorted(EXTRACTION_MODES)}")
+    backend = request_value('backend', DEFAULT_BACKEND).lower()
+    if backend not in PIPELINES:
+        raise ValueError(f"Invalid backend, expected one of {sorted(PIPELINES)}")
+    return {"backend": backend, "image_profile": request_image_profile(), "mode": mode}
+
+
+def request_priority():
+    """Read the lane of the request's LLM calls (interactive, or bulk for backfills), raising ValueError."""
+    priority = request_value('priority', INTERACTIVE).lower()
+    if priority not in LANES:
+        raise ValueError(f"Invalid priority, expected one of {list(LANES)}")
+    return priority
+
+
+def upload_path(upload_folder, filename, index=None):
+    """
+    Path to save an upload to: its sanitized name, prefixed with its position
+    when several files of a submission share the folder (names may repeat).
+    """
+    name = secure_filename(filename)
+    if '.' not in name:
+        # Only the extension survived sanitizing (e.g. a non-ASCII name).
+        name = f"upload.{filename.rsplit('.', 1)[1].lower()}"
+    if index is not None:
+        name = f"{index}_{name}"
+    return os.path.join(upload_folder, name)
+
+
+def save_upload(file, filename):
+    """
+    Identify the upload from its first bytes, stream it to disk and check that it
+    can be processed. Returns its content type (pdf, image or text); raises
+    InvalidUploadError, with nothing left on disk, when it is rejected.
+    """
+    content_type = check_upload_head(file.filename, file.stream.read(SNIFF_BYTES))
+    file.stream.seek(0)
+    with span(UPLOAD_SAVE) as counters:
+        file.save(filename)
+        counters["request_bytes"] = os.path.getsize(filename)
+    try:
+        validate_document(filename, content_type)
+    except InvalidUploadError:
+        os.remove(filename)
+        raise
+    store_upload(filename)
+    return content_type
+
+
+def reject_upload(upload_folder, error, **details):
+    shutil.rmtree(upload_folder, ignore_errors=True)
+    return jsonify({"error": str(error), **details}), error.status
+
+
+def extraction_result(filename, submission_id, response, trace):
+    if not response:
+        return ({
+            "message": "Error extracting data from the document.",
+            "filename": filename,
+            "submission_id": submission_id,
+            "timings": trace.summary()
+        })
+    return jsonify({
+        "message": "Data Extracted Successfully.",
+        "filename": filename,
+        "submission_id": submission_id,
+        "application_details": response,
+        "timings": trace.summary()
+    }), 200
+
+
+def accepted_for_processing(filename, submission_id):
+    return jsonify({
+        "message": "Document accepted for processing.",
+        "filename": filename,
+        "submission_id": submission_id,
+        "status_url": f"/api/submissions/{submission_id}"
+    }), 202
+
+
+def format_event(event, data, stream_format):
+    if stream_format == 'ndjson':
+        return json.dumps({"event": event, **data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload larger than {MAX_UPLOAD_MB:g} MB"}), 413
+
+
 @app.route('/',methods=['GET'])
 def index():
     return jsonify({
@@ -48,8 +178,11 @@ def upload_file():
     upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(submission_id))
     os.makedirs(upload_folder, exist_ok=True)
     if file and allowed_file(file.filename):
-        filename = os.path.join(upload_folder, file.filename)
-        file.save(filename)
+        filename = upload_path(upload_folder, file.filename)
+        try:
+            save_upload(file, filename)
+        except InvalidUploadError as e:
+            return reject_upload(upload_folder, e, filename=file.filename)
         return jsonify(
             {"message": "File uploaded successfully", "filename": file.filename, "submission_id": submission_id}), 200
 
@@ -66,30 +199,254 @@ def document_processing():
 
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
+    try:
+        options = request_processing_options()
+        priority = request_priority()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     submission_id = str(uuid4())
     upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], submission_id)
     os.makedirs(upload_folder, exist_ok=True)
     if file and allowed_file(file.filename):
-        filename = os.path.join(upload_folder, file.filename)
-        file.save(filename)
-        response = match_extracted_with_template(file_path=filename,submission_id=submission_id)
-        if not response:
-            return ({
-                "message": "Error extracting data from the document.",
-                "filename": file.filename,
-                "submission_id": submission_id
-            })
-        return jsonify({
-            "message": "Data Extracted Successfully.",
-            "filename": file.filename,
-            "submission_id": submission_id,
-            "application_details": response
-        }), 200
+        filename = upload_path(upload_folder, file.filename)
+        with tracing(submission_id) as trace, priority_lane(priority):
+            try:
+                content_type = save_upload(file, filename)
+            except InvalidUploadError as e:
+                return reject_upload(upload_folder, e, filename=file.filename)
+            if request_flag('async'):
+                try:
+                    job_queue.submit(submission_id, run_pipeline, file_path=filename, submission_id=submission_id,
+                                     content_type=content_type, **options)
+                except QueueFullError as e:
+                    return jsonify({"error": str(e), "filename": file.filename}), 429
+                return accepted_for_processing(file.filename, submission_id)
+            response = job_queue.run(submission_id, run_pipeline, file_path=filename, submission_id=submission_id,
+                                     content_type=content_type, **options)
+        return extraction_result(file.filename, submission_id, response, trace)
     # os.rmdir(upload_folder)
 
     return jsonify({"error": "Invalid file type"}), 400
 
 
-# Run the app
+# asyncio version of /api/process_doc: the extraction runs on the shared event loop, waiting on the LLM
+# APIs without holding threads, so one process keeps many extractions in flight (async=true frees the
+# request at once; otherwise the request waits for the result)
+@app.route('/api/async/process_doc', methods=['POST'])
+async def document_processing_async():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Invalid file type"}), 400
+    try:
+        options = request_processing_options()
+        priority = request_priority()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    submission_id = str(uuid4())
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], submission_id)
+    os.makedirs(upload_folder, exist_ok=True)
+    filename = upload_path(upload_folder, file.filename)
+    with tracing(submission_id) as trace, priority_lane(priority):
+        try:
+            content_type = save_upload(file, filename)
+        except InvalidUploadError as e:
+            return reject_upload(upload_folder, e, filename=file.filename)
+        if request_flag('async'):
+            try:
+                job_queue.submit_async(submission_id, arun_pipeline, file_path=filename,
+                                       submission_id=submission_id, content_type=content_type, **options)
+            except QueueFullError as e:
+                return jsonify({"error": str(e), "filename": file.filename}), 429
+            return accepted_for_processing(file.filename, submission_id)
+        response = await event_loop.run(job_queue.run_async(submission_id, arun_pipeline, file_path=filename,
+                                                            submission_id=submission_id, content_type=content_type,
+                                                            **options))
+    return extraction_result(file.filename, submission_id, response, trace)
+
+
+# Route for processing several documents of one submission (application, loss runs, supplements...)
+@app.route('/api/process_batch', methods=['POST'])
+def batch_processing():
+    files = request.files.getlist('file')
+    if not files:
+        return jsonify({"error": "No file part in the request"}), 400
+    if any(file.filename == '' for file in files):
+        return jsonify({"error": "No file selected"}), 400
+    invalid = [file.filename for file in files if not allowed_file(file.filename)]
+    if invalid:
+        return jsonify({"error": "Invalid file type", "filenames": invalid}), 400
+    try:
+        options = request_processing_options()
+        priority = request_priority()
+        concurrency = int(request_value('concurrency', 0)) or None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    submission_id = str(uuid4())
+    # All documents of the submission share one upload folder, as create_database.load_documents expects.
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], submission_id)
+    os.makedirs(upload_folder, exist_ok=True)
+    filenames = [file.filename for file in files]
+    with tracing(submission_id) as trace, priority_lane(priority):
+        file_paths = []
+        for index, file in enumerate(files):
+            filename = upload_path(upload_folder, file.filename, index)
+            try:
+                save_upload(file, filename)
+            except InvalidUploadError as e:
+                return reject_upload(upload_folder, e, filename=file.filename)
+            file_paths.append(filename)
+        if request_flag('async'):
+            try:
+                job_queue.submit(submission_id, run_batch, file_paths=file_paths, submission_id=submission_id,
+                                 concurrency=concurrency, filenames=filenames, **options)
+            except QueueFullError as e:
+                return jsonify({"error": str(e), "filenames": filenames}), 429
+            return jsonify({
+                "message": "Documents accepted for processing.",
+                "filenames": filenames,
+                "submission_id": submission_id,
+                "status_url": f"/api/submissions/{submission_id}"
+            }), 202
+        result = job_queue.run(submission_id, run_batch, file_paths=file_paths, submission_id=submission_id,
+                               concurrency=concurrency, filenames=filenames, **options)
+    if not result:
+        return jsonify({
+            "message": "Error extracting data from the documents.",
+            "filenames": filenames,
+            "submission_id": submission_id,
+            "timings": trace.summary()
+        })
+    return jsonify({
+        "message": "Data Extracted Successfully.",
+        "filenames": filenames,
+        "submission_id": submission_id,
+        **result,
+        "timings": trace.summary()
+    }), 200
+
+
+# Route for processing a document while streaming progress events (SSE, or NDJSON with format=ndjson)
+@app.route('/api/process_doc/stream', methods=['POST'])
+def document_processing_stream():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Invalid file type"}), 400
+    try:
+        options = request_processing_options()
+        priority = request_priority()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream_format = 'ndjson' if request_value('format') == 'ndjson' else 'sse'
+    submission_id = str(uuid4())
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], submission_id)
+    os.makedirs(upload_folder, exist_ok=True)
+    filename = upload_path(upload_folder, file.filename)
+
+    events = queue.Queue()
+
+    def progress(event, data):
+        events.put((event, data))
+
+    def run(content_type):
+        try:
+            response = run_pipeline(file_path=filename, submission_id=submission_id, content_type=content_type,
+                                    progress=progress, **options)
+            if response:
+                progress("result", {"message": "Data Extracted Successfully.", "application_details": response,
+                                    "timings": current_trace().summary()})
+            else:
+                progress("error", {"message": "Error extracting data from the document.",
+                                   "timings": current_trace().summary()})
+            return response
+        except Exception as e:
+            progress("error", {"message": str(e)})
+            raise
+        finally:
+            events.put(None)
+
+    with tracing(submission_id), priority_lane(priority):
+        try:
+            content_type = save_upload(file, filename)
+        except InvalidUploadError as e:
+            return reject_upload(upload_folder, e, filename=file.filename)
+        try:
+            job_queue.submit(submission_id, run, content_type)
+        except QueueFullError as e:
+            return jsonify({"error": str(e), "filename": file.filename}), 429
+
+    def generate():
+        yield format_event("accepted", {"filename": file.filename, "submission_id": submission_id}, stream_format)
+        while True:
+            try:
+                item = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Keeps load balancers from closing the connection while the model is busy.
+                yield ": keep-alive\n\n" if stream_format == 'sse' else "\n"
+                continue
+            if item is None:
+                break
+            yield format_event(*item, stream_format)
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'text/event-stream'
+    return Response(generate(), mimetype=mimetype, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Route for polling the status and result of a submission
+@app.route('/api/submissions/<submission_id>', methods=['GET'])
+def submission_status(submission_id):
+    submission = read_submission(submission_id)
+    if submission is None:
+        return jsonify({"error": "Submission not found"}), 404
+    return jsonify(submission), 200
+
+
+# Route for inspecting the extraction cache
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(extraction_cache.stats()), 200
+
+
+# Route for inspecting storage usage (from the last sweeper pass) and free disk space
+@app.route('/api/storage/stats', methods=['GET'])
+def storage_stats():
+    return jsonify(storage_sweeper.stats()), 200
+
+
+# Route exposing per-stage latency, byte and token metrics in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    queue_stats = job_queue.stats()
+    disk = disk_usage()
+    gauges = {
+        "herald_jobs_running": ("Extraction jobs currently running.", queue_stats["running"]),
+        "herald_jobs_queued": ("Extraction jobs waiting for a worker.", queue_stats["queued"]),
+        "herald_async_jobs_running": ("Extraction jobs in flight on the asyncio pipeline.",
+                                      queue_stats["async_running"]),
+        "herald_disk_free_bytes": ("Free space on the storage volume.", disk["free_bytes"]),
+        "herald_disk_free_inodes": ("Free inodes on the storage volume.", disk["free_inodes"]),
+    }
+    for scheduler in (openai_scheduler, gemini_scheduler):
+        if scheduler.enabled:
+            for name, value in scheduler.stats().items():
+                gauges[f"herald_llm_{scheduler.name}_{name}"] = (
+                    f"LLM calls waiting in the lane, or budget left, of the {scheduler.name} scheduler.", value)
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+# Run the app with the development server; production runs gunicorn -c gunicorn.conf.py app:app
 if __name__ == '__main__':
-    app.run(host="0.0.0.0",debug=True)
+    storage_sweeper.start()
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")),
+            debug=os.getenv("FLASK_DEBUG", "true").lower() in {'1', 'true', 'yes'})
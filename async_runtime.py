@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """
+    Event loop running in a daemon thread, shared by the asyncio pipeline of the
+    process. Its HTTP clients and semaphores are bound to this loop, so every
+    coroutine of the pipeline runs on it, whichever thread or loop awaits it.
+
+    The thread is started on first use, after gunicorn has forked the workers.
+    """
+
+    def __init__(self, name="asyncio-pipeline"):
+        self.name = name
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
+    def submit(self, coroutine):
+        """Schedule a coroutine on the loop from any thread; return a concurrent.futures.Future."""
+        # The task runs in a copy of the caller's context, so the submission trace follows it.
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    async def run(self, coroutine):
+        """Await a coroutine on the shared loop from another event loop (e.g. a Flask async view)."""
+        loop = self.loop()
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+
+event_loop = EventLoopThread()
@@ -0,0 +1,263 @@
+"""
+Offline backfill: re-extract archived documents into the current template
+without going through the HTTP API.
+
+Walks directories (and/or a manifest listing one path per line), and runs
+match_extracted_with_template on each document from a thread or process pool,
+in the bulk lane of the LLM token scheduler. Every outcome is appended to a
+JSONL file with its per-stage timings, which doubles as the checkpoint: a
+rerun skips the documents it already holds for the same content, template,
+backend and mode, so a crashed run resumes where it stopped. Documents whose
+template response is in the extraction cache are written from it without any
+LLM call.
+
+    python backfill.py archive/ --output output/backfill.jsonl --workers 8
+    python backfill.py --manifest paths.txt --backend openai-rag --processes --parquet backfill.parquet
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+from extraction_cache import extraction_cache, file_sha256, MAPPED
+from llm_scheduler import priority_lane, BULK, LANES
+from metrics import tracing
+from pipeline import match_extracted_with_template, pipeline_for, DEFAULT_BACKEND, PIPELINES
+from template_store import template_store
+from text_layer import EXTRACTION_MODE, EXTRACTION_MODES
+from upload_validation import check_upload_head, validate_document, InvalidUploadError, EXTENSION_TYPES, SNIFF_BYTES
+
+# Load environment variables
+load_dotenv()
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+BACKFILL_OUTPUT = os.getenv("BACKFILL_OUTPUT", os.path.join("output", "backfill.jsonl"))
+
+# Record statuses; documents with a DONE status are skipped when the run is resumed, failed ones are retried.
+OK = "ok"
+CACHED = "cached"
+FAILED = "failed"
+INVALID = "invalid"
+DONE = {OK, CACHED, INVALID}
+
+
+def discover_documents(paths=(), manifest=None):
+    """Return the documents to process: files under the directories, the files given and those of the manifest."""
+    candidates = list(paths)
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as manifest_file:
+            for line in manifest_file:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    candidates.append(os.path.join(base, line))
+    documents = []
+    for path in candidates:
+        if os.path.isdir(path):
+            for root, folders, files in os.walk(path):
+                folders.sort()
+                documents.extend(os.path.join(root, name) for name in sorted(files)
+                                 if name.rsplit(".", 1)[-1].lower() in EXTENSION_TYPES)
+        else:
+            documents.append(path)
+    # Keep the first occurrence of each file, in the order given.
+    return list(dict.fromkeys(os.path.abspath(path) for path in documents))
+
+
+def record_key(path, sha256, template_hash, backend, mode):
+    return path, sha256, template_hash, backend, mode
+
+
+def read_checkpoint(output_path):
+    """Return the keys of the documents the output file already holds a DONE record for."""
+    done = set()
+    try:
+        with open(output_path) as output_file:
+            for line in output_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of a crashed run may be cut off.
+                    continue
+                if record.get("status") in DONE:
+                    done.add(record_key(record["path"], record["sha256"], record["template_hash"],
+                                        record["backend"], record["mode"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def open_output(output_path):
+    """Open the output file for appending, starting on a new line if a crashed run left a partial one."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    output_file = open(output_path, "a+b")
+    if output_file.tell():
+        output_file.seek(-1, os.SEEK_END)
+        if output_file.read(1) != b"\n":
+            output_file.write(b"\n")
+    return output_file
+
+
+def append_record(output_file, record):
+    # One line per document, on disk before the next one is reported: the file is the checkpoint.
+    output_file.write(json.dumps(record).encode("utf-8") + b"\n")
+    output_file.flush()
+    os.fsync(output_file.fileno())
+
+
+def extract_document(job):
+    """Extract one document in the given lane and return its record. Runs in the pool's threads or processes."""
+    submission_id = str(uuid4())
+    started = time.perf_counter()
+    status, response, error = FAILED, None, None
+    with tracing(submission_id) as trace, priority_lane(job["priority"]):
+        try:
+            validate_document(job["path"], job["content_type"])
+            response = match_extracted_with_template(job["path"], submission_id, mode=job["mode"],
+                                                     backend=job["backend"])
+            if response is not None:
+                status = OK
+        except InvalidUploadError as e:
+            status, error = INVALID, str(e)
+        except Exception as e:
+            print(f"Error processing {job['path']}: {e}")
+            error = str(e)
+    return {**job["record"], "status": status, "submission_id": submission_id,
+            "seconds": round(time.perf_counter() - started, 3), "timings": trace.summary(),
+            "application_details": response, "error": error, "finished_at": time.time()}
+
+
+def plan_document(path, template, backend, mode, done):
+    """
+    Return (record, job) for a document: the record alone when it needs no
+    extraction (already done, cached or invalid), otherwise the job to run.
+    """
+    record = {"path": path, "sha256": None, "template_hash": template["hash"], "backend": backend, "mode": mode}
+    try:
+        record["sha256"] = file_sha256(path)
+        if record_key(path, record["sha256"], template["hash"], backend, mode) in done:
+            return None, None
+        with open(path, "rb") as document:
+            content_type = check_upload_head(os.path.basename(path), document.read(SNIFF_BYTES))
+    except (InvalidUploadError, OSError) as e:
+        return {**record, "status": INVALID, "error": str(e), "finished_at": time.time()}, None
+    cache_key = pipeline_for(backend, content_type).cache_key(record["sha256"], template, mode=mode)
+    cached = extraction_cache.get(MAPPED, cache_key)
+    if cached is not None:
+        return {**record, "status": CACHED, "seconds": 0.0, "application_details": cached,
+                "finished_at": time.time()}, None
+    return None, {"path": path, "content_type": content_type, "backend": backend, "mode": mode, "record": record}
+
+
+def run_backfill(documents, output_path=BACKFILL_OUTPUT, backend=DEFAULT_BACKEND, mode=EXTRACTION_MODE,
+                 workers=BACKFILL_WORKERS, processes=False, priority=BULK):
+    """
+    Extract the documents into the output JSONL, skipping those it already
+    holds; return the count per status ("skipped" for the checkpointed ones)
+    and the run's duration.
+    """
+    template = template_store.get()
+    done = read_checkpoint(output_path)
+    counts = {}
+    started = time.perf_counter()
+    if processes:
+        # Fresh interpreters: the workers must not inherit the parent's SQLite connection or threads.
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    with open_output(output_path) as output_file, executor:
+        def write(record):
+            append_record(output_file, record)
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            seconds = f" in {record['seconds']:.1f}s" if record.get("seconds") else ""
+            print(f"[{sum(counts.values())}/{len(documents)}] {record['status']} {record['path']}{seconds}")
+
+        pending = set()
+        try:
+            for path in documents:
+                record, job = plan_document(path, template, backend, mode, done)
+                if job is not None:
+                    # Keep a couple of jobs per worker queued, so an interrupted run stops promptly.
+                    while len(pending) >= 2 * workers:
+                        completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in completed:
+                            write(future.result())
+                    pending.add(executor.submit(extract_document, {**job, "priority": priority}))
+                elif record is not None:
+                    write(record)
+                else:
+                    counts["skipped"] = counts.get("skipped", 0) + 1
+            for future in wait(pending).done:
+                write(future.result())
+        except KeyboardInterrupt:
+            # Documents already being extracted are finished and recorded; the queued ones are left for the rerun.
+            for future in pending:
+                future.cancel()
+            for future in wait(pending).done:
+                if not future.cancelled() and future.exception() is None:
+                    write(future.result())
+            print("Interrupted; run the same command again to resume.")
+            raise
+    counts["seconds"] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+def export_parquet(output_path, parquet_path):
+    """Write the latest record of each document of the output JSONL to a Parquet file (needs pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("Parquet export needs pyarrow: pip install pyarrow")
+        return False
+    latest = {}
+    with open(output_path) as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            latest[record_key(record["path"], record["sha256"], record["template_hash"], record["backend"],
+                              record["mode"])] = record
+    # Responses and timings follow the template and the stages, so they are kept as JSON text.
+    rows = [{**record, "application_details": json.dumps(record.get("application_details")),
+             "timings": json.dumps(record.get("timings"))} for record in latest.values()]
+    columns = ["path", "sha256", "template_hash", "backend", "mode", "status", "submission_id", "seconds",
+               "error", "finished_at", "application_details", "timings"]
+    pq.write_table(pa.Table.from_pylist([{column: row.get(column) for column in columns} for row in rows]),
+                   parquet_path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="documents or directories to walk")
+    parser.add_argument("--manifest", help="file listing one document path per line (relative to the file)")
+    parser.add_argument("--output", default=BACKFILL_OUTPUT, help="append-only JSONL output and checkpoint")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=sorted(PIPELINES))
+    parser.add_argument("--mode", default=EXTRACTION_MODE, choices=sorted(EXTRACTION_MODES))
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="documents extracted at a time")
+    parser.add_argument("--processes", action="store_true",
+                        help="use worker processes instead of threads (token budgets then apply per process)")
+    parser.add_argument("--priority", default=BULK, choices=LANES, help="lane of the LLM calls")
+    parser.add_argument("--parquet", help="also export the latest record per document to this Parquet file")
+    args = parser.parse_args()
+    if not args.paths and not args.manifest:
+        parser.error("give documents, directories or a --manifest")
+
+    documents = discover_documents(args.paths, args.manifest)
+    counts = run_backfill(documents, args.output, backend=args.backend, mode=args.mode, workers=args.workers,
+                          processes=args.processes, priority=args.priority)
+    if args.parquet:
+        export_parquet(args.output, args.parquet)
+    print(json.dumps({"documents": len(documents), **counts}, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,139 +1,564 @@
 import json
 
-import requests
 from dotenv import load_dotenv
 import os
+import asyncio
 import base64
+import time
 
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import ChatOpenAI
-from pdf2image import convert_from_path
+from PIL import Image
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import async_openai_client, openai_client
+from extraction_cache import extraction_cache, file_sha256, make_key, INSIGHTS
+from llm_json import finish_json, parse_json_response, JsonStreamParser
+from llm_scheduler import estimate_chat_tokens, openai_scheduler
+from metrics import bind, span, ENCODE, OUTPUT_WRITE, RASTERIZE, VISION_CALL
+from text_layer import classify_pages, EXTRACTION_MODE
 
 
 # Load environment variables
 load_dotenv()
 openai_api_key = os.getenv('OPENAI_API_KEY')
 
-def pdf_to_base64_images(pdf_path, dpi=200):
+VISION_MODEL = "gpt-4o"
+# Bump whenever a prompt changes so cached results of the old prompt are not reused.
+PROMPT_VERSION = "3"
+VISION_MAX_TOKENS = int(os.getenv('VISION_MAX_TOKENS', '2000'))
+# Pages per vision call; longer documents are split into windows sent concurrently (0 disables sharding).
+VISION_SHARD_PAGES = int(os.getenv('VISION_SHARD_PAGES', '0'))
+VISION_SHARD_CONCURRENCY = int(os.getenv('VISION_SHARD_CONCURRENCY', '4'))
+
+# Pages rendered per pdf2image call; peak memory grows with this, not with the page count.
+RASTER_BATCH_PAGES = int(os.getenv('RASTER_BATCH_PAGES', '4'))
+# Threads used both by poppler for rendering and by the PNG/Base64 encoder.
+RASTER_THREADS = int(os.getenv('RASTER_THREADS', '4'))
+
+
+# Default image encoding profile, overridable per deployment (environment) or per request.
+IMAGE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+DEFAULT_IMAGE_PROFILE = {
+    "format": os.getenv('IMAGE_FORMAT', 'png').lower(),
+    "quality": int(os.getenv('IMAGE_QUALITY', '85')),
+    "grayscale": os.getenv('IMAGE_GRAYSCALE', 'false').lower() in {'1', 'true', 'yes'},
+    "max_edge": int(os.getenv('IMAGE_MAX_EDGE', '0')),
+    "dpi": int(os.getenv('IMAGE_DPI', '200')),
+}
+
+
+def build_image_profile(**overrides):
+    """Return the default image profile updated with the non-empty overrides, validated."""
+    profile = dict(DEFAULT_IMAGE_PROFILE)
+    profile.update({key: value for key, value in overrides.items() if value not in (None, '')})
+    profile["format"] = str(profile["format"]).lower()
+    if profile["format"] == "jpg":
+        profile["format"] = "jpeg"
+    if profile["format"] not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {profile['format']}")
+    profile["quality"] = int(profile["quality"])
+    profile["max_edge"] = int(profile["max_edge"])
+    profile["dpi"] = int(profile["dpi"])
+    if isinstance(profile["grayscale"], str):
+        profile["grayscale"] = profile["grayscale"].lower() in {'1', 'true', 'yes'}
+    if not 1 <= profile["quality"] <= 100 or profile["max_edge"] < 0 or not 36 <= profile["dpi"] <= 600:
+        raise ValueError(f"Invalid image profile: {profile}")
+    return profile
+
+
+def encode_image(page, profile=None):
+    """Encode a rendered page as a Base64 data URL following the image profile and release the bitmap."""
+    profile = profile or DEFAULT_IMAGE_PROFILE
+    image = page
+    if profile["grayscale"]:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if profile["max_edge"] and max(image.size) > profile["max_edge"]:
+        if image is page:
+            image = image.copy()
+        image.thumbnail((profile["max_edge"], profile["max_edge"]))
+
+    with span(ENCODE, pages=1) as counters:
+        buffered = BytesIO()
+        if profile["format"] == "png":
+            image.save(buffered, format="PNG")
+        else:
+            image.save(buffered, format=IMAGE_FORMATS[profile["format"]], quality=profile["quality"])
+        if image is not page:
+            image.close()
+        page.close()
+        img = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        counters["response_bytes"] = len(img)
+    return f"data:image/{profile['format']};base64,{img}"
+
+
+def _page_runs(page_numbers, batch_size):
+    """Group sorted page numbers into contiguous (first, last) runs of at most batch_size pages."""
+    runs = []
+    for page_number in page_numbers:
+        if runs and page_number == runs[-1][1] + 1 and page_number - runs[-1][0] < batch_size:
+            runs[-1][1] = page_number
+        else:
+            runs.append([page_number, page_number])
+    return runs
+
+
+def iter_pdf_base64_images(pdf_path, profile=None, page_numbers=None, batch_size=RASTER_BATCH_PAGES,
+                           thread_count=RASTER_THREADS):
+    """Yield PDF pages (all, or only page_numbers) as Base64-encoded images, rendering at most batch_size pages at a time."""
+    from pdf2image import convert_from_path, pdfinfo_from_path
+
+    profile = profile or DEFAULT_IMAGE_PROFILE
+    if page_numbers is None:
+        page_numbers = range(1, pdfinfo_from_path(pdf_path)["Pages"] + 1)
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        for first_page, last_page in _page_runs(sorted(page_numbers), batch_size):
+            with span(RASTERIZE, pages=last_page - first_page + 1):
+                pages = convert_from_path(pdf_path, dpi=profile["dpi"], first_page=first_page, last_page=last_page,
+                                          grayscale=profile["grayscale"],
+                                          thread_count=min(thread_count, last_page - first_page + 1))
+            yield from executor.map(bind(lambda page: encode_image(page, profile)), pages)
+            del pages
+
+
+def pdf_to_base64_images(pdf_path, profile=None):
     """Convert PDF pages to Base64-encoded images."""
-    base64_images = []
     try:
-        pages = convert_from_path(pdf_path, dpi=dpi)
-        for page in pages:
-            buffered = BytesIO()
-            page.save(buffered, format="PNG")
-            img = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            img_base64 = f"data:image/png;base64,{img}"
-
-            base64_images.append(img_base64)
+        return list(iter_pdf_base64_images(pdf_path, profile=profile))
     except Exception as e:
         print(f"Error converting PDF to Base64 images: {e}")
         return None
-    return base64_images
 
-def fetch_insights(pdf_path,submission_id):
-    """Fetch insights from the OpenAI API by sending PDF pages as Base64 images."""
-    try:
-        # Convert PDF to Base64 images
-        images = pdf_to_base64_images(pdf_path)
-        if not images:
-            return "No images generated from the PDF."
 
-        # Construct API request payload
-        messages = [
+def save_output(submission_id, name, data):
+    """Write a JSON artifact to ./output/<submission_id>/<name>."""
+    response_output_path = f"./output/{submission_id}/{name}"
+    with span(OUTPUT_WRITE) as counters:
+        os.makedirs(os.path.dirname(response_output_path), exist_ok=True)
+        content = json.dumps(data, indent=4)
+        with open(response_output_path, "w") as output_file:
+            output_file.write(content)
+        counters["response_bytes"] = len(content)
+
+
+def notify(progress, event, **data):
+    """Report a pipeline event to the optional progress callback."""
+    if progress is not None:
+        progress(event, data)
+
+
+def image_content(img_base64):
+    return {
+        "type": "image_url",  # Adjust if image_base64 is not compatible
+        "image_url": {"url": img_base64}
+    }
+
+
+def build_page_content(pdf_path, mode=EXTRACTION_MODE, image_profile=None, progress=None):
+    """Return one chat content item per page: its text layer when usable, otherwise its rendered image."""
+    if mode == "vision":
+        pages = [image_content(img) for img in iter_pdf_base64_images(pdf_path, profile=image_profile)]
+        notify(progress, "pages_prepared", pages=len(pages), text_pages=0, image_pages=len(pages))
+        return pages
+
+    pages = classify_pages(pdf_path, mode)
+    raster_pages = [page_number for page_number, text in pages if text is None]
+    images = {}
+    if raster_pages:
+        images = dict(zip(raster_pages, iter_pdf_base64_images(pdf_path, profile=image_profile,
+                                                               page_numbers=raster_pages)))
+    print(f"Sending {len(pages) - len(raster_pages)} page(s) as text and {len(raster_pages)} as images.")
+    notify(progress, "pages_prepared", pages=len(pages), text_pages=len(pages) - len(raster_pages),
+           image_pages=len(raster_pages))
+    return [
+        {"type": "text", "text": f"Page {page_number}:\n{text}"} if text is not None
+        else image_content(images[page_number])
+        for page_number, text in pages
+    ]
+
+
+def record_usage(counters, usage):
+    """Add the token usage of a chat completion to span counters."""
+    counters["prompt_tokens"] = (usage or {}).get("prompt_tokens", 0)
+    counters["completion_tokens"] = (usage or {}).get("completion_tokens", 0)
+
+
+class StreamedCompletion:
+    """
+    Accumulates the content deltas of a streamed chat completion from its SSE lines, reporting progress
+    as they arrive. Received bytes and the final usage chunk are recorded into the optional span
+    counters, and the deltas are fed to the optional JsonStreamParser.
+    """
+
+    def __init__(self, progress=None, report_every=500, counters=None, parser=None):
+        self.progress = progress
+        self.report_every = report_every
+        self.counters = counters if counters is not None else {}
+        self.counters["response_bytes"] = 0
+        self.parser = parser
+        self.parts = []
+        self.received = self.reported = 0
+
+    def add_line(self, line):
+        """Process one line of the stream; return False once the stream is done."""
+        self.counters["response_bytes"] += len(line or "") + 1
+        if not line or not line.startswith("data:"):
+            return True
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return False
+        chunk = json.loads(payload)
+        if chunk.get("usage"):
+            record_usage(self.counters, chunk["usage"])
+        for choice in chunk.get("choices", []):
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                self.parts.append(delta)
+                self.received += len(delta)
+                if self.parser is not None:
+                    self.parser.feed(delta)
+        if self.received - self.reported >= self.report_every:
+            notify(self.progress, "vision_progress", characters=self.received)
+            self.reported = self.received
+        return True
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def read_streamed_content(response, progress=None, report_every=500, counters=None, parser=None):
+    """Read a streamed chat completion (see StreamedCompletion) and return its content."""
+    completion = StreamedCompletion(progress, report_every, counters, parser)
+    for line in response.iter_lines(decode_unicode=True):
+        if not completion.add_line(line):
+            break
+    return completion.text()
+
+
+async def aread_streamed_content(response, progress=None, report_every=500, counters=None, parser=None):
+    """Read a streamed httpx chat completion (see StreamedCompletion) and return its content."""
+    completion = StreamedCompletion(progress, report_every, counters, parser)
+    async for line in response.aiter_lines():
+        if not completion.add_line(line):
+            break
+    return completion.text()
+
+
+def vision_request(pages, instruction, stream=False):
+    """Build the chat completion payload sending the page content items to the vision model."""
+    data = {
+        "model": VISION_MODEL,
+        "messages": [
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": "Extract all information from the document in JSON format"}
-                ]
+                "content": [{"type": "text", "text": instruction}] + list(pages)
             }
-        ]
-
-        # Attach images to the payload
-        for img_base64 in images:
-            messages[0]["content"].append({
-                "type": "image_url",  # Adjust if image_base64 is not compatible
-                "image_url": {"url": img_base64}
-            })
-
-        data = {
-            "model": "gpt-4o",
-            "messages": messages,
-            "max_tokens": 2000,
-            "temperature": 0,
-        }
-
-        # Send the request
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            json=data,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {openai_api_key}",
-            },
-        )
-
-        if response.status_code == 200:
-            response_text = response.json().get("choices", [{}])[0].get("message", {}).get("content", "No insights.")
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-
-            if 0 <= json_start < json_end:
-                json_str = response_text[json_start:json_end]
-                parsed_response = json.loads(json_str)
-
-                response_output_path = f"./output/{submission_id}/extracted_data.json"
-                os.makedirs(os.path.dirname(response_output_path), exist_ok=True)
-                with open(response_output_path, "w") as output_file:
-                    json.dump(parsed_response, output_file, indent=4)
-
-                return parsed_response
+        ],
+        "max_tokens": VISION_MAX_TOKENS,
+        "temperature": 0,
+    }
+    if stream:
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}
+    return data
+
+
+def vision_cost(data):
+    """Estimated token cost of a vision request: its text and image parts and the completion limit."""
+    return estimate_chat_tokens(data["messages"], data["max_tokens"])
+
+
+def parse_vision_response(response_text, parser=None):
+    """Return the JSON of a vision answer, from the parser it was streamed into when there is one."""
+    if parser is not None:
+        return finish_json(parser, len(response_text))[0]
+    return parse_json_response(response_text)[0]
+
+
+def request_insights(pages, instruction="Extract all information from the document in JSON format", progress=None):
+    """
+    Send page content items (text or Base64 images) to the vision model and return the parsed JSON, or None.
+    With a progress callback the completion is streamed and reported as it is generated.
+    """
+    data = vision_request(pages, instruction, stream=progress is not None)
+
+    # Wait for the token budget, then send the request over the shared pooled client (retries 429/5xx with backoff)
+    with openai_scheduler.admit(vision_cost(data)) as ticket, span(VISION_CALL, pages=len(pages)) as counters:
+        if progress is not None:
+            response = openai_client.request("POST", "/chat/completions", json=data, stream=True)
         else:
-            print(f"API Error: {response.status_code}, {response.text}")
+            response = openai_client.post_json("/chat/completions", data)
+        counters["request_bytes"] = len(response.request.body or b"")
+
+        parser = None
+        try:
+            if response.status_code == 200:
+                if progress is not None:
+                    # The JSON is parsed while it streams in; a completion cut at max_tokens keeps its complete
+                    # members.
+                    parser = JsonStreamParser()
+                    response_text = read_streamed_content(response, progress, counters=counters,
+                                                          parser=parser) or "No insights."
+                else:
+                    counters["response_bytes"] = len(response.content)
+                    body = response.json()
+                    record_usage(counters, body.get("usage"))
+                    response_text = body.get("choices", [{}])[0].get("message", {}).get("content", "No insights.")
+            else:
+                # Read the error body before closing, it is printed below.
+                response.content
+                response_text = None
+        finally:
+            # A stream is left unread after [DONE]; closing it frees the connection and its concurrency slot.
+            response.close()
+        ticket.settle(counters)
+    if response_text is not None:
+        return parse_vision_response(response_text, parser)
+    print(f"API Error: {response.status_code}, {response.text}")
+    return None
+
+
+async def arequest_insights(pages, instruction="Extract all information from the document in JSON format",
+                            progress=None):
+    """asyncio version of request_insights, over the shared httpx client."""
+    data = vision_request(pages, instruction, stream=progress is not None)
+
+    async with openai_scheduler.admit_async(vision_cost(data)) as ticket:
+        with span(VISION_CALL, pages=len(pages)) as counters:
+            response = await async_openai_client.request("POST", "/chat/completions", json=data,
+                                                         stream=progress is not None)
+            counters["request_bytes"] = len(response.request.content or b"")
+            parser = None
+            try:
+                if response.status_code == 200:
+                    if progress is not None:
+                        parser = JsonStreamParser()
+                        response_text = await aread_streamed_content(response, progress, counters=counters,
+                                                                     parser=parser) or "No insights."
+                    else:
+                        counters["response_bytes"] = len(response.content)
+                        body = response.json()
+                        record_usage(counters, body.get("usage"))
+                        response_text = body.get("choices", [{}])[0].get("message", {}).get("content",
+                                                                                            "No insights.")
+                else:
+                    await response.aread()
+                    response_text = None
+            finally:
+                await response.aclose()
+            ticket.settle(counters)
+    if response_text is not None:
+        return parse_vision_response(response_text, parser)
+    print(f"API Error: {response.status_code}, {response.text}")
+    return None
+
+
+def _is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def merge_insights(partials, conflicts=None, path=""):
+    """
+    Merge the JSON extracted from consecutive page windows into one dict.
+
+    Windows are merged in page order. Dicts are merged key by key, lists are
+    concatenated without exact duplicates, and for scalar values the first
+    non-empty value (the one from the earliest pages) wins. Every differing
+    value that is dropped is recorded in conflicts.
+    """
+    merged = {}
+    for partial in partials:
+        for key, value in (partial or {}).items():
+            key_path = f"{path}.{key}" if path else key
+            if key not in merged or _is_empty(merged[key]):
+                merged[key] = value
+            elif _is_empty(value):
+                continue
+            elif isinstance(merged[key], dict) and isinstance(value, dict):
+                merged[key] = merge_insights([merged[key], value], conflicts, key_path)
+            elif isinstance(merged[key], list) and isinstance(value, list):
+                merged[key] = merged[key] + [item for item in value if item not in merged[key]]
+            elif merged[key] != value and conflicts is not None:
+                conflicts.append({"path": key_path, "kept": merged[key], "dropped": value})
+    return merged
+
+
+def shard_windows(pages, shard_pages=None):
+    """Split the page content items into (first page index, pages) windows of shard_pages pages."""
+    shard_pages = shard_pages or VISION_SHARD_PAGES
+    return [(first, pages[first:first + shard_pages]) for first in range(0, len(pages), shard_pages)]
+
+
+def shard_instruction(first, window_pages, page_count):
+    return (f"Extract all information from pages {first + 1}-{first + len(window_pages)} of a {page_count} page "
+            f"document in JSON format")
+
+
+def shard_timing(first, window_pages, started, result):
+    return {"pages": [first + 1, first + len(window_pages)], "seconds": round(time.perf_counter() - started, 3),
+            "ok": result is not None}
+
+
+def merge_shard_results(submission_id, shard_results):
+    """Merge the (result, timing) pairs of the windows and write shards.json; return None if a window failed."""
+    timings = [timing for _, timing in shard_results]
+    conflicts = []
+    merged = None
+    if all(result is not None for result, _ in shard_results):
+        merged = merge_insights([result for result, _ in shard_results], conflicts)
+    save_output(submission_id, "shards.json", {"shards": timings, "conflicts": conflicts})
+    print(f"Vision shards for {submission_id}: {timings}")
+    return merged
+
+
+def fetch_sharded_insights(pages, submission_id, shard_pages=None, concurrency=None, progress=None):
+    """Send page windows concurrently and merge their results, or return None if a window fails."""
+    def run_shard(window):
+        first, window_pages = window
+        started = time.perf_counter()
+        result = request_insights(window_pages, instruction=shard_instruction(first, window_pages, len(pages)))
+        timing = shard_timing(first, window_pages, started, result)
+        notify(progress, "shard_done", **timing)
+        return result, timing
+
+    with ThreadPoolExecutor(max_workers=concurrency or VISION_SHARD_CONCURRENCY) as executor:
+        shard_results = list(executor.map(bind(run_shard), shard_windows(pages, shard_pages)))
+    return merge_shard_results(submission_id, shard_results)
+
+
+async def afetch_sharded_insights(pages, submission_id, shard_pages=None, concurrency=None, progress=None):
+    """asyncio version of fetch_sharded_insights."""
+    limit = asyncio.Semaphore(concurrency or VISION_SHARD_CONCURRENCY)
+
+    async def run_shard(window):
+        first, window_pages = window
+        async with limit:
+            started = time.perf_counter()
+            result = await arequest_insights(window_pages,
+                                             instruction=shard_instruction(first, window_pages, len(pages)))
+        timing = shard_timing(first, window_pages, started, result)
+        notify(progress, "shard_done", **timing)
+        return result, timing
+
+    shard_results = await asyncio.gather(*(run_shard(window) for window in shard_windows(pages, shard_pages)))
+    return await asyncio.to_thread(merge_shard_results, submission_id, shard_results)
+
+
+def insights_cache_key(pdf_path, pdf_hash, mode, image_profile):
+    return make_key(pdf_hash or file_sha256(pdf_path), VISION_MODEL, VISION_MAX_TOKENS, VISION_SHARD_PAGES,
+                    PROMPT_VERSION, mode, image_profile or DEFAULT_IMAGE_PROFILE)
+
+
+def cached_insights(submission_id, cache_key, progress=None):
+    cached = extraction_cache.get(INSIGHTS, cache_key)
+    if cached is not None:
+        save_output(submission_id, "extracted_data.json", cached)
+        notify(progress, "vision_done", cached=True)
+    return cached
+
+
+def store_insights(submission_id, cache_key, parsed_response, progress=None):
+    notify(progress, "vision_done", cached=False)
+    save_output(submission_id, "extracted_data.json", parsed_response)
+    if cache_key is not None:
+        extraction_cache.set(INSIGHTS, cache_key, parsed_response)
+    return parsed_response
+
+
+def fetch_insights(pdf_path,submission_id,image_profile=None,pdf_hash=None,mode=None,progress=None):
+    """Fetch insights from the OpenAI API by sending PDF pages as text or Base64 images."""
+    mode = mode or EXTRACTION_MODE
+    try:
+        cache_key = insights_cache_key(pdf_path, pdf_hash, mode, image_profile)
+        cached = cached_insights(submission_id, cache_key, progress)
+        if cached is not None:
+            return cached
+
+        try:
+            pages = build_page_content(pdf_path, mode=mode, image_profile=image_profile, progress=progress)
+        except Exception as e:
+            print(f"Error converting PDF pages: {e}")
             return None
+        if not pages:
+            return "No images generated from the PDF."
+
+        if VISION_SHARD_PAGES and len(pages) > VISION_SHARD_PAGES:
+            parsed_response = fetch_sharded_insights(pages, submission_id, progress=progress)
+        else:
+            parsed_response = request_insights(pages, progress=progress)
+        if parsed_response is None:
+            return None
+        return store_insights(submission_id, cache_key, parsed_response, progress)
 
     except Exception as e:
         print(f"Error fetching insights: {str(e)}")
         return None
 
 
-def match_extracted_with_template(file_path,submission_id):
-    # file_path = f'uploads/a79de526-e0cf-4571-a9c0-2f817e4d3735/sample1.pdf'
-    data = fetch_insights(pdf_path=file_path,submission_id=submission_id)
-    if not data:
-        return None
-    model = ChatOpenAI(model="gpt-4o", temperature=0.1)
-    with open('sample/template/template.json') as file:
-        structure = file.read()
-    system_prompt = (f'You are an AI assistant specialized in extracting information from a document.'
-                     f'Please analyze the provided text and extract information in the following JSON format:'
-                     f'replace the <value> with actual value and keep field blank if value is not found.'
-                     f'Return the full structure given below:'
-                     f'{structure}')
+async def afetch_insights(pdf_path, submission_id, image_profile=None, pdf_hash=None, mode=None, progress=None):
+    """
+    asyncio version of fetch_insights; hashing, cache lookups, artifact writes, text extraction and
+    rasterization run in the default executor.
+    """
+    mode = mode or EXTRACTION_MODE
     try:
-        response = model.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Please extract the information from the following text:\n\n{data}")
-        ])
+        cache_key = await asyncio.to_thread(insights_cache_key, pdf_path, pdf_hash, mode, image_profile)
+        cached = await asyncio.to_thread(cached_insights, submission_id, cache_key, progress)
+        if cached is not None:
+            return cached
+
+        try:
+            pages = await asyncio.to_thread(build_page_content, pdf_path, mode=mode, image_profile=image_profile,
+                                            progress=progress)
+        except Exception as e:
+            print(f"Error converting PDF pages: {e}")
+            return None
+        if not pages:
+            return "No images generated from the PDF."
+
+        if VISION_SHARD_PAGES and len(pages) > VISION_SHARD_PAGES:
+            parsed_response = await afetch_sharded_insights(pages, submission_id, progress=progress)
+        else:
+            parsed_response = await arequest_insights(pages, progress=progress)
+        if parsed_response is None:
+            return None
+        return await asyncio.to_thread(store_insights, submission_id, cache_key, parsed_response, progress)
 
-        response_text = response.content
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
+    except Exception as e:
+        print(f"Error fetching insights: {str(e)}")
+        return None
 
-        if 0 <= json_start < json_end:
-            json_str = response_text[json_start:json_end]
-            parsed_response = json.loads(json_str)
 
-            response_output_path = f"./output/{submission_id}/output.json"
-            os.makedirs(os.path.dirname(response_output_path), exist_ok=True)
-            with open(response_output_path, "w") as output_file:
-                json.dump(parsed_response, output_file, indent=4)
+def encode_image_file(image_path, image_profile=None, progress=None):
+    """Encode an image upload with the image profile as the single page content item."""
+    with Image.open(image_path) as image:
+        pages = [image_content(encode_image(image, image_profile))]
+    notify(progress, "pages_prepared", pages=1, text_pages=0, image_pages=1)
+    return pages
 
-            return parsed_response
-        else:
-            print("No JSON content found in response.")
+
+def fetch_image_insights(image_path, submission_id, image_profile=None, progress=None, **options):
+    """Fetch insights from an image upload, encoded with the image profile and sent as is (no PDF rendering)."""
+    try:
+        pages = encode_image_file(image_path, image_profile, progress)
+        parsed_response = request_insights(pages, progress=progress)
+        if parsed_response is None:
             return None
-    finally:
-        print("process done")
+        return store_insights(submission_id, None, parsed_response, progress)
+    except Exception as e:
+        print(f"Error fetching image insights: {str(e)}")
+        return None
+
 
+async def afetch_image_insights(image_path, submission_id, image_profile=None, progress=None, **options):
+    """asyncio version of fetch_image_insights; the image is encoded in the default executor."""
+    try:
+        pages = await asyncio.to_thread(encode_image_file, image_path, image_profile, progress)
+        parsed_response = await arequest_insights(pages, progress=progress)
+        if parsed_response is None:
+            return None
+        return await asyncio.to_thread(store_insights, submission_id, None, parsed_response, progress)
+    except Exception as e:
+        print(f"Error fetching image insights: {str(e)}")
+        return None
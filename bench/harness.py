@@ -0,0 +1,133 @@
+"""
+Offline end-to-end benchmark: synthetic PDFs through the extraction pipelines
+against the local OpenAI-compatible stub server.
+
+Reports per-stage latency percentiles, throughput at the given concurrency,
+peak RSS and payload bytes as JSON, so runs can be diffed for regressions.
+
+    python -m bench.harness --documents 4 --pages 6 --concurrency 4 --latency 0.3 \
+        --backend openai-vision --backend openai-rag --output bench_output.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from bench.stub_server import start_server
+from bench.synthetic import write_corpus
+
+# First pipeline event marking the end of the extraction stage, per backend kind.
+EXTRACTION_EVENTS = ("vision_done", "context_retrieved")
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(share):
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 4)
+
+    return {"count": len(ordered), "mean": round(statistics.mean(ordered), 4), "p50": at(0.5), "p95": at(0.95),
+            "p99": at(0.99), "max": round(ordered[-1], 4)}
+
+
+def run_document(run_pipeline, backend, path, mode):
+    """Run one document and return its stage timings in seconds."""
+    events = {}
+    started = time.perf_counter()
+
+    def progress(event, data):
+        events.setdefault(event, time.perf_counter() - started)
+
+    try:
+        ok = run_pipeline(backend, file_path=path, submission_id=str(uuid4()), mode=mode, progress=progress) is not None
+        error = None
+    except Exception as e:
+        ok, error = False, str(e)
+    total = time.perf_counter() - started
+    extracted = next((events[event] for event in EXTRACTION_EVENTS if event in events), None)
+    timings = {"total": total, "ok": ok, "error": error}
+    if "pages_prepared" in events:
+        timings["prepare"] = events["pages_prepared"]
+    if extracted is not None:
+        timings["extract"] = extracted
+        timings["map"] = total - extracted
+    return timings
+
+
+def run_scenario(run_pipeline, backend, documents, mode, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda path: run_document(run_pipeline, backend, path, mode), documents))
+    wall = time.perf_counter() - started
+    successful = [result for result in results if result["ok"]]
+    return {
+        "documents": len(results),
+        "succeeded": len(successful),
+        "errors": sorted({result["error"] for result in results if result["error"]}),
+        "wall_seconds": round(wall, 4),
+        "throughput_docs_per_second": round(len(successful) / wall, 4) if wall else None,
+        "stages": {stage: percentiles([result[stage] for result in successful if stage in result])
+                   for stage in ("prepare", "extract", "map", "total")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=4, help="documents per variant")
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--variant", action="append", choices=["text", "scanned"])
+    parser.add_argument("--backend", action="append", help="pipeline backend, repeatable (default openai-vision)")
+    parser.add_argument("--mode", default="auto")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-per-kb", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="herald-bench-")
+    server, state, base_url = start_server(latency=args.latency, latency_per_kb=args.latency_per_kb,
+                                           error_rate=args.error_rate)
+    # The pipeline modules read their configuration at import time, so point
+    # them at the stub (and disable result caching) before importing them.
+    os.environ.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "stub",
+        "EXTRACTION_CACHE_ENABLED": "false",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache"),
+        "EMBEDDING_CHECK_CTX_LENGTH": "false",
+        "HTTP_BACKOFF_BASE": "0.05",
+    })
+    from pipeline import run_pipeline
+
+    variants = args.variant or ["text", "scanned"]
+    corpus = write_corpus(workdir, args.documents, args.pages, variants=variants)
+    report = {
+        "config": vars(args),
+        "scenarios": [],
+    }
+    for backend in args.backend or ["openai-vision"]:
+        for variant in variants:
+            documents = [path for document_variant, path in corpus if document_variant == variant]
+            scenario = run_scenario(run_pipeline, backend, documents, args.mode, args.concurrency)
+            report["scenarios"].append({"backend": backend, "variant": variant, **scenario})
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    report["stub_endpoints"] = state.stats
+    server.shutdown()
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
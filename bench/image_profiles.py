@@ -0,0 +1,84 @@
+"""
+Compare image encoding profiles on a PDF: payload bytes per page and, when an
+expected template response is given, extraction accuracy against its fields.
+
+    python -m bench.image_profiles sample.pdf \
+        --profile png --profile jpeg:quality=70,grayscale=true,max_edge=1600 \
+        --expected expected_output.json
+"""
+import argparse
+import json
+import time
+from uuid import uuid4
+
+from base64_processing import build_image_profile, iter_pdf_base64_images
+from pipeline import match_extracted_with_template
+
+
+def parse_profile(spec):
+    """Parse '<format>[:key=value,...]' into an image profile."""
+    image_format, _, options = spec.partition(':')
+    overrides = dict(option.split('=', 1) for option in options.split(',') if option)
+    return build_image_profile(format=image_format, **overrides)
+
+
+def field_values(template_response):
+    """Map every template field id to its value."""
+    values = {}
+    for section, id_key in (("coverage_values", "coverage_parameter_id"), ("risk_values", "risk_parameter_id")):
+        for field in (template_response or {}).get(section, []):
+            values[field.get(id_key)] = field.get("value")
+    return values
+
+
+def normalize(value):
+    return str(value if value is not None else '').strip().lower()
+
+
+def accuracy(expected, actual):
+    expected_values = field_values(expected)
+    actual_values = field_values(actual)
+    matched = sum(normalize(value) == normalize(actual_values.get(field_id))
+                  for field_id, value in expected_values.items())
+    return matched / len(expected_values) if expected_values else None
+
+
+def measure(pdf_path, profile, expected=None):
+    started = time.perf_counter()
+    sizes = [len(image) for image in iter_pdf_base64_images(pdf_path, profile=profile)]
+    result = {
+        "profile": profile,
+        "pages": len(sizes),
+        "payload_bytes": sum(sizes),
+        "bytes_per_page": sum(sizes) / len(sizes) if sizes else 0,
+        "encode_seconds": round(time.perf_counter() - started, 3),
+    }
+    if expected is not None:
+        started = time.perf_counter()
+        # Every page is sent as an image, so the accuracy depends on the profile (auto sends text layers as text).
+        response = match_extracted_with_template(file_path=pdf_path, submission_id=str(uuid4()),
+                                                 image_profile=profile, mode="vision", backend="openai-vision")
+        result["extraction_seconds"] = round(time.perf_counter() - started, 3)
+        result["accuracy"] = accuracy(expected, response)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_path")
+    parser.add_argument("--profile", action="append", default=[],
+                        help="'<format>[:quality=..,grayscale=..,max_edge=..,dpi=..]', repeatable")
+    parser.add_argument("--expected", help="template response with the expected values, enables accuracy")
+    args = parser.parse_args()
+
+    expected = None
+    if args.expected:
+        with open(args.expected) as expected_file:
+            expected = json.load(expected_file)
+    profiles = [parse_profile(spec) for spec in args.profile] or [build_image_profile()]
+    results = [measure(args.pdf_path, profile, expected) for profile in profiles]
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Load test of the HTTP server: the Flask development server (python app.py)
+or gunicorn with gunicorn.conf.py, both backed by the local stub LLM server.
+
+Starts the server in a subprocess, has --clients concurrent clients post a
+synthetic PDF to /api/process_doc (--route sync) or to its asyncio version
+/api/async/process_doc (--route async) for --duration seconds, and reports
+sustained requests per second, latency percentiles and the peak number of server
+threads as JSON.
+
+    python -m bench.load_test --server flask --server gunicorn --clients 16 --duration 30 --latency 1
+    python -m bench.load_test --server gunicorn --route sync --route async --clients 128 --latency 2 \
+        --env GUNICORN_THREADS=256
+
+With --burst N, N documents are instead submitted at once as background jobs
+(async=true) and the report gives the time until all of them are done, the jobs
+accepted or refused (429) and the peak number of jobs in flight and of threads.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from bench.harness import percentiles
+from bench.stub_server import start_server
+from bench.synthetic import write_corpus
+
+SERVER_COMMANDS = {
+    "flask": [sys.executable, "app.py"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+}
+ROUTES = {
+    "sync": "/api/process_doc",
+    "async": "/api/async/process_doc",
+}
+
+
+def start_app_server(server, port, base_url, workdir, extra_env=None, startup_timeout=60):
+    """Start the app server on port with the LLM APIs pointed at the stub, and wait until it answers."""
+    env = dict(os.environ,
+               **(extra_env or {}),
+               PORT=str(port),
+               GUNICORN_BIND=f"127.0.0.1:{port}",
+               OPENAI_BASE_URL=base_url,
+               OPENAI_API_KEY="stub",
+               EXTRACTION_CACHE_ENABLED="false",
+               EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache"),
+               EMBEDDING_CHECK_CTX_LENGTH="false")
+    process = subprocess.Popen(SERVER_COMMANDS[server], env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=5)
+            return process
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.5)
+    stop_app_server(process)
+    raise RuntimeError(f"{server} did not start on port {port}")
+
+
+def stop_app_server(process):
+    # The server runs in its own session; stop the whole group (Flask reloader, gunicorn workers).
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def count_threads(process_group):
+    """Number of threads of all processes in a process group."""
+    threads = 0
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # Fields after the command name: state, ppid, pgrp, ..., num_threads (the 18th).
+        if int(fields[2]) == process_group:
+            threads += int(fields[17])
+    return threads
+
+
+def sample_peak_threads(process_group, stop, interval=0.5):
+    """Sample the thread count of a process group until stop is set; return a dict holding the peak."""
+    peak = {"threads": 0}
+
+    def sample():
+        while not stop.wait(interval):
+            peak["threads"] = max(peak["threads"], count_threads(process_group))
+
+    threading.Thread(target=sample, daemon=True).start()
+    return peak
+
+
+def run_load(url, pdf_path, clients, duration, backend):
+    """Post the PDF from concurrent clients until duration elapses; return (latencies, status counts)."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    with open(pdf_path, "rb") as pdf_file:
+        content = pdf_file.read()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                status = session.post(url, files={"file": ("load_test.pdf", content, "application/pdf")},
+                                      data={"backend": backend}, timeout=600).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def run_burst(base_url, route, pdf_path, count, clients, backend, poll_interval=0.5, timeout=600, priority=None):
+    """Submit count background jobs from concurrent clients and wait until all are done; return the report."""
+    with open(pdf_path, "rb") as pdf_file:
+        content = pdf_file.read()
+    submission_ids = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = list(range(count))
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                remaining.pop()
+            response = session.post(f"{base_url}{ROUTES[route]}", params={"async": "true"},
+                                    files={"file": ("burst.pdf", content, "application/pdf")},
+                                    data={"backend": backend, "priority": priority or "interactive"}, timeout=60)
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 202:
+                    submission_ids.append(response.json()["submission_id"])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    submitted_seconds = time.perf_counter() - started
+
+    peak_in_flight = 0
+    outcomes = {}
+    pending = set(submission_ids)
+    while pending and time.perf_counter() - started < timeout:
+        metrics = requests.get(f"{base_url}/metrics", timeout=30).text
+        peak_in_flight = max(peak_in_flight, sum(
+            float(line.split()[-1]) for line in metrics.splitlines()
+            if line.startswith(("herald_jobs_running ", "herald_async_jobs_running "))))
+        for submission_id in list(pending):
+            status = requests.get(f"{base_url}/api/submissions/{submission_id}", timeout=30).json()["status"]
+            if status in ("completed", "failed"):
+                outcomes[status] = outcomes.get(status, 0) + 1
+                pending.discard(submission_id)
+        time.sleep(poll_interval)
+    drain_seconds = time.perf_counter() - started
+    return {
+        "submitted_seconds": round(submitted_seconds, 3),
+        "drain_seconds": round(drain_seconds, 3),
+        "jobs_per_second": round(outcomes.get("completed", 0) / drain_seconds, 3),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "outcomes": {**outcomes, "pending": len(pending)},
+        "peak_jobs_in_flight_per_worker": peak_in_flight,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", action="append", choices=sorted(SERVER_COMMANDS),
+                        help="server to test, repeatable (default flask and gunicorn)")
+    parser.add_argument("--route", action="append", choices=sorted(ROUTES),
+                        help="route to test, repeatable (default sync)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="environment variable of the app server, repeatable")
+    parser.add_argument("--burst", type=int, default=0, help="submit this many background jobs at once")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--backend", default="openai-vision")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub LLM latency in seconds")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="herald-load-")
+    stub, _, base_url = start_server(latency=args.latency)
+    pdf_path = write_corpus(workdir, 1, args.pages, variants=["text"])[0][1]
+    report = {"config": vars(args), "results": []}
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    for server in args.server or ["flask", "gunicorn"]:
+        for route in args.route or ["sync"]:
+            process = start_app_server(server, args.port, base_url, workdir, extra_env)
+            stop = threading.Event()
+            peak = sample_peak_threads(process.pid, stop)
+            try:
+                if args.burst:
+                    result = run_burst(f"http://127.0.0.1:{args.port}", route, pdf_path, args.burst, args.clients,
+                                       args.backend)
+                else:
+                    latencies, statuses = run_load(f"http://127.0.0.1:{args.port}{ROUTES[route]}", pdf_path,
+                                                   args.clients, args.duration, args.backend)
+            finally:
+                stop.set()
+                stop_app_server(process)
+            if args.burst:
+                report["results"].append({"server": server, "route": route, **result,
+                                          "peak_server_threads": peak["threads"]})
+                continue
+            report["results"].append({
+                "server": server,
+                "route": route,
+                "requests_per_second": round(len(latencies) / args.duration, 3),
+                "statuses": {str(status): count for status, count in statuses.items()},
+                "latency": percentiles(latencies),
+                "peak_server_threads": peak["threads"],
+            })
+    stub.shutdown()
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare the per-request latency of the retriever backends on a synthetic
+single-document corpus: build the store, add the chunks, run the queries.
+
+Embeddings are computed by a deterministic local model so only the storage
+and search overhead is measured.
+
+    python -m bench.retrieval --chunks 20 --queries 8 --repeat 20
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from dataprocessing.retrieval import build_retriever, RETRIEVER_BACKENDS
+
+
+def synthetic_chunks(count, size=1000):
+    return [Document(page_content=f"chunk {index} " + f"field_{index} value {index} " * (size // 20))
+            for index in range(count)]
+
+
+def measure(backend, chunks, queries, k):
+    embedding_function = DeterministicFakeEmbedding(size=1536)
+    with tempfile.TemporaryDirectory() as persist_directory:
+        started = time.perf_counter()
+        retriever = build_retriever(embedding_function, persist_directory=persist_directory, backend=backend)
+        retriever.add_documents(chunks)
+        indexed = time.perf_counter()
+        retriever.search_by_vectors(embedding_function.embed_documents(queries), k=k)
+        finished = time.perf_counter()
+    return {"index_seconds": indexed - started, "search_seconds": finished - indexed,
+            "total_seconds": finished - started}
+
+
+def summarize(samples):
+    totals = sorted(sample["total_seconds"] for sample in samples)
+    return {
+        "runs": len(samples),
+        "index_ms_mean": 1000 * statistics.mean(sample["index_seconds"] for sample in samples),
+        "search_ms_mean": 1000 * statistics.mean(sample["search_seconds"] for sample in samples),
+        "total_ms_p50": 1000 * totals[len(totals) // 2],
+        "total_ms_p95": 1000 * totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=8)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--backend", action="append", choices=sorted(RETRIEVER_BACKENDS))
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    queries = [f"field_{index}" for index in range(args.queries)]
+    results = {}
+    for backend in args.backend or sorted(RETRIEVER_BACKENDS):
+        try:
+            samples = [measure(backend, chunks, queries, args.k) for _ in range(args.repeat)]
+        except ImportError as e:
+            results[backend] = {"skipped": str(e)}
+            continue
+        results[backend] = summarize(samples)
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Interactive latency while a bulk backfill runs, with and without the LLM token scheduler.
+
+Starts the stub LLM server with a tokens-per-minute limit and, per scenario, a
+gunicorn worker pointed at it. The bulk scenario submits --bulk background jobs
+(priority=bulk) at once; --clients interactive clients then post documents and
+wait for the result for --duration seconds. The report gives the interactive
+latency percentiles, the interactive extractions that failed, the bulk jobs
+completed and the 429s answered by the stub, for:
+
+  idle         interactive clients only, no scheduler
+  unscheduled  interactive clients during the backfill, no scheduler
+  scheduled    interactive clients during the backfill, OPENAI_TPM_BUDGET set
+
+    python -m bench.scheduler --tokens-per-minute 300000 --bulk 60 --clients 2 --duration 60
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+import requests
+
+from bench.harness import percentiles
+from bench.load_test import run_burst, start_app_server, stop_app_server, ROUTES
+from bench.stub_server import start_server
+from bench.synthetic import write_corpus
+
+
+def run_interactive(url, pdf_path, clients, duration, backend):
+    """Post the PDF from concurrent clients until duration elapses; return (latencies, failures)."""
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    with open(pdf_path, "rb") as pdf_file:
+        content = pdf_file.read()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = session.post(url, files={"file": ("interactive.pdf", content, "application/pdf")},
+                                        data={"backend": backend, "priority": "interactive"}, timeout=600)
+                ok = response.status_code == 200 and "application_details" in response.json()
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else failures).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures
+
+
+def run_scenario(args, pdf_path, workdir, bulk, extra_env):
+    stub, state, base_url = start_server(latency=args.latency, tokens_per_minute=args.tokens_per_minute)
+    env = {"GUNICORN_WORKERS": "1", "GUNICORN_MAX_REQUESTS": "0", "JOB_QUEUE_SIZE": "1000", **extra_env}
+    process = start_app_server("gunicorn", args.port, base_url, workdir, env)
+    app_url = f"http://127.0.0.1:{args.port}"
+    burst = {}
+    try:
+        if bulk:
+            backfill = threading.Thread(target=lambda: burst.update(run_burst(
+                app_url, args.route, pdf_path, bulk, 8, args.backend, timeout=args.bulk_timeout, priority="bulk")))
+            backfill.start()
+            # Let the backlog reach the API before the interactive clients start.
+            time.sleep(args.warmup)
+        latencies, failures = run_interactive(f"{app_url}{ROUTES[args.route]}", pdf_path, args.clients,
+                                              args.duration, args.backend)
+        if bulk:
+            backfill.join()
+    finally:
+        stop_app_server(process)
+        stub.shutdown()
+    completions = state.stats.get("completions", {})
+    return {
+        "interactive_latency": percentiles(latencies),
+        "interactive_failed": len(failures),
+        "bulk_outcomes": burst.get("outcomes"),
+        "bulk_drain_seconds": burst.get("drain_seconds"),
+        "stub_completions": completions.get("requests", 0),
+        "stub_rate_limited": completions.get("errors", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens-per-minute", type=int, default=300000, help="token limit of the stub")
+    parser.add_argument("--budget-share", type=float, default=0.9,
+                        help="OPENAI_TPM_BUDGET of the scheduled run, as a share of the stub limit")
+    parser.add_argument("--bulk", type=int, default=60, help="background jobs of the backfill")
+    parser.add_argument("--bulk-timeout", type=float, default=600)
+    parser.add_argument("--clients", type=int, default=2, help="interactive clients")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=5, help="seconds between the backfill and the clients")
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--route", choices=sorted(ROUTES), default="async")
+    parser.add_argument("--backend", default="openai-vision")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub LLM latency in seconds")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="herald-scheduler-")
+    pdf_path = write_corpus(workdir, 1, args.pages, variants=["text"])[0][1]
+    budget = {"OPENAI_TPM_BUDGET": str(int(args.tokens_per_minute * args.budget_share))}
+    report = {"config": vars(args), "results": {}}
+    for name, bulk, extra_env in (("idle", 0, {}), ("unscheduled", args.bulk, {}),
+                                  ("scheduled", args.bulk, budget)):
+        report["results"][name] = run_scenario(args, pdf_path, workdir, bulk, extra_env)
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
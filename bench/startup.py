@@ -0,0 +1,91 @@
+"""
+Cold start benchmark: import time of the app and latency of the first and
+second requests in fresh interpreters, against the local stub LLM server.
+
+Each run starts a new process, so module imports and client creation are paid
+again as in a freshly scaled-out container. With --warm-up the clients are
+created (pipeline.warm_up) between the import and the first request.
+
+    python -m bench.startup --runs 5 --backend openai-vision --backend openai-rag
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def probe(pdf_path, backend, warm_up):
+    """Run inside the fresh interpreter: time the import, the optional warm-up and two requests."""
+    started = time.perf_counter()
+    import app
+    timings = {"import_seconds": time.perf_counter() - started}
+    if warm_up:
+        from pipeline import warm_up as warm_up_backend
+        started = time.perf_counter()
+        warm_up_backend(backend)
+        timings["warm_up_seconds"] = time.perf_counter() - started
+    client = app.app.test_client()
+    for name in ("first_request_seconds", "second_request_seconds"):
+        with open(pdf_path, "rb") as pdf_file:
+            started = time.perf_counter()
+            response = client.post("/api/process_doc", data={"file": (pdf_file, "startup.pdf"), "backend": backend})
+            timings[name] = time.perf_counter() - started
+        if response.status_code != 200:
+            timings["error"] = response.get_json()
+    timings["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", action="append", help="pipeline backend, repeatable (default openai-vision)")
+    parser.add_argument("--warm-up", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--probe", nargs=2, metavar=("PDF", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.probe:
+        probe(*args.probe, warm_up=args.warm_up)
+        return
+
+    from bench.stub_server import start_server
+    from bench.synthetic import write_corpus
+
+    workdir = tempfile.mkdtemp(prefix="herald-startup-")
+    server, _, base_url = start_server(latency=args.latency)
+    pdf_path = write_corpus(workdir, 1, 3, variants=["text"])[0][1]
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="stub", EXTRACTION_CACHE_ENABLED="false",
+               EMBEDDING_CACHE_PATH=os.path.join(workdir, "embedding_cache"), EMBEDDING_CHECK_CTX_LENGTH="false")
+    report = {"config": {key: value for key, value in vars(args).items() if key != "probe"}, "results": []}
+    for backend in args.backend or ["openai-vision"]:
+        runs = []
+        for _ in range(args.runs):
+            command = [sys.executable, "-m", "bench.startup", "--probe", pdf_path, backend]
+            if args.warm_up:
+                command.append("--warm-up")
+            output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        errors = [run["error"] for run in runs if "error" in run]
+        report["results"].append({
+            "backend": backend,
+            **{f"median_{name}": round(statistics.median(run[name] for run in runs), 4)
+               for name in runs[0] if name != "error"},
+            "errors": errors,
+        })
+    server.shutdown()
+
+    output = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Local OpenAI-compatible stub server for offline benchmarks.
+
+Serves /v1/chat/completions (plain and streamed) and /v1/embeddings with a
+configurable latency and error injection, and counts the request and response
+bytes per endpoint. Mapping prompts get a value for every field id listed in
+the system prompt, so the whole template pipeline is exercised.
+
+With --tokens-per-minute the stub enforces a provider token limit: completions
+are charged their prompt tokens (images by tiles) plus max_tokens, or the
+answer when there is none, and answered 429 with a Retry-After when they do
+not fit the budget, of which 10 seconds' worth can be spent in one burst.
+
+    python -m bench.stub_server --port 8089 --latency 0.5 --error-rate 0.05 --tokens-per-minute 30000
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_scheduler import estimate_chat_tokens
+
+FIELD_LINE = re.compile(r"^((?:cvg|rsk)_[0-9a-z_]+) \| [^|\n]* \| (\w+)", re.MULTILINE)
+# Answers that pass the validation of each template input_type.
+TYPED_VALUES = {"date": "2025-01-01", "currency": 1000, "integer": 10, "select_many": ["stub"],
+                "email": "stub@example.com", "phone": "555-0100", "domain": "example.com",
+                "address": {"line1": "1 Stub Street", "city": "Stub"}}
+EMBEDDING_SIZE = 256
+# Seconds of the token limit that can be spent in one burst, like the provider's short enforcement windows.
+LIMIT_WINDOW_SECONDS = 10
+
+
+def fake_embedding(text, size=EMBEDDING_SIZE):
+    """Deterministic pseudo-random vector derived from the text hash."""
+    seed = hashlib.sha256(str(text).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(size)]
+
+
+def completion_text(body):
+    """Answer mapping prompts with a value per listed field and vision prompts with a small document."""
+    messages = body.get("messages", [])
+    system = " ".join(str(message.get("content")) for message in messages if message.get("role") == "system")
+    fields = FIELD_LINE.findall(system)
+    if fields:
+        return json.dumps({field_id: TYPED_VALUES.get(field_type, "stub") for field_id, field_type in fields})
+    content = messages[-1].get("content") if messages else ""
+    pages = len(content) - 1 if isinstance(content, list) else 1
+    return json.dumps({"document": {"pages": pages, "applicant": {"name": "Stub Corp"}}})
+
+
+class StubState:
+    def __init__(self, latency=0.0, latency_per_kb=0.0, error_rate=0.0, tokens_per_minute=0, seed=0):
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.error_rate = error_rate
+        self.tokens_per_minute = tokens_per_minute
+        self.capacity = tokens_per_minute * LIMIT_WINDOW_SECONDS / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, endpoint, request_bytes, response_bytes, status):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {"requests": 0, "errors": 0, "request_bytes": 0,
+                                                     "response_bytes": 0})
+            stats["requests"] += 1
+            stats["errors"] += status != 200
+            stats["request_bytes"] += request_bytes
+            stats["response_bytes"] += response_bytes
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def rate_limited(self, cost):
+        """Charge a completion to the token limit; return 0, or the seconds until it would fit."""
+        if not self.tokens_per_minute:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.tokens_per_minute / 60)
+            self.updated = now
+            if self.tokens >= min(cost, self.capacity):
+                self.tokens -= cost
+                return 0
+            return (min(cost, self.capacity) - self.tokens) * 60 / self.tokens_per_minute
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, endpoint, request_bytes, status, body, content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            state.record(endpoint, request_bytes, len(body), status)
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+            time.sleep(state.latency + state.latency_per_kb * len(raw) / 1024)
+            if state.should_fail():
+                status = 429 if state.random.random() < 0.5 else 500
+                self._send(endpoint, len(raw), status, b'{"error": {"message": "injected"}}',
+                           headers={"Retry-After": "0"})
+                return
+            body = json.loads(raw or b"{}")
+            if endpoint == "completions":
+                self._completion(endpoint, len(raw), body)
+            elif endpoint == "embeddings":
+                self._embeddings(endpoint, len(raw), body)
+            else:
+                self._send(endpoint, len(raw), 404, b'{"error": {"message": "not found"}}')
+
+        def _completion(self, endpoint, request_bytes, body):
+            text = completion_text(body)
+            prompt_tokens = estimate_chat_tokens(body.get("messages", []))
+            wait = state.rate_limited(prompt_tokens + (body.get("max_tokens") or len(text) // 4))
+            if wait:
+                self._send(endpoint, request_bytes, 429, b'{"error": {"message": "Rate limit reached for tokens '
+                           b'per min", "code": "rate_limit_exceeded"}}', headers={"Retry-After": f"{wait:.3f}"})
+                return
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                     "total_tokens": prompt_tokens + len(text) // 4}
+            base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+            if body.get("stream"):
+                events = []
+                for start in range(0, len(text), 64):
+                    chunk = dict(base, object="chat.completion.chunk", choices=[
+                        {"index": 0, "delta": {"role": "assistant", "content": text[start:start + 64]},
+                         "finish_reason": None}])
+                    events.append(f"data: {json.dumps(chunk)}\n\n")
+                final = dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                events.append(f"data: {json.dumps(final)}\n\n")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = dict(base, object="chat.completion.chunk", choices=[], usage=usage)
+                    events.append(f"data: {json.dumps(usage_chunk)}\n\n")
+                events.append("data: [DONE]\n\n")
+                self._send(endpoint, request_bytes, 200, "".join(events).encode(), "text/event-stream")
+                return
+            response = dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}])
+            self._send(endpoint, request_bytes, 200, json.dumps(response).encode())
+
+        def _embeddings(self, endpoint, request_bytes, body):
+            inputs = body.get("input", [])
+            if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            data = []
+            for index, item in enumerate(inputs):
+                vector = fake_embedding(item)
+                if body.get("encoding_format") == "base64":
+                    vector = base64.b64encode(struct.pack(f"{len(vector)}f", *vector)).decode()
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            response = {"object": "list", "data": data, "model": body.get("model", "stub"),
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+            self._send(endpoint, request_bytes, 200, json.dumps(response).encode())
+
+    return Handler
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog (5) drops connections when many clients connect at once.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def start_server(port=0, **options):
+    """Start the stub server on a background thread; returns (server, state, base_url)."""
+    state = StubState(**options)
+    server = StubHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--latency-per-kb", type=float, default=0.0, help="seconds added per KB of request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 429/500")
+    parser.add_argument("--tokens-per-minute", type=int, default=0, help="token limit of the completions")
+    args = parser.parse_args()
+    server, _, base_url = start_server(args.port, latency=args.latency, latency_per_kb=args.latency_per_kb,
+                                       error_rate=args.error_rate, tokens_per_minute=args.tokens_per_minute)
+    print(f"Stub server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
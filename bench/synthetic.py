@@ -0,0 +1,96 @@
+"""
+Synthetic insurance application PDFs for benchmarks: a born-digital variant
+with a text layer and a scanned variant made of page images only.
+"""
+import random
+
+from PIL import Image, ImageDraw
+
+FIELDS = [
+    ("Applicant Name", lambda rng: rng.choice(["Acme Corp", "Globex LLC", "Initech Inc"])),
+    ("Cyber Effective Date", lambda rng: f"{rng.randint(1, 12):02d}/01/2025"),
+    ("Aggregate Limit", lambda rng: f"${rng.choice([1, 2, 5])},000,000"),
+    ("Per Claim Retention", lambda rng: f"${rng.choice([1000, 2500, 5000]):,}"),
+    ("Annual Revenue", lambda rng: f"${rng.randint(1, 50) * 1000000:,}"),
+    ("Number of Employees", lambda rng: str(rng.randint(5, 500))),
+    ("Primary Contact Email", lambda rng: "risk@example.com"),
+    ("Business Income Coverage Limit", lambda rng: f"${rng.choice([250, 500])},000"),
+    ("Social Engineering Limit", lambda rng: f"${rng.choice([100, 250])},000"),
+    ("Has the applicant experienced a cyber incident", lambda rng: rng.choice(["Yes", "No"])),
+]
+LINES_PER_PAGE = 40
+
+
+def page_lines(page_number, rng):
+    lines = [f"Cyber Insurance Application - Page {page_number}"]
+    while len(lines) < LINES_PER_PAGE:
+        label, value = rng.choice(FIELDS)
+        lines.append(f"{label}: {value(rng)}")
+    return lines
+
+
+def document_pages(pages, seed=0):
+    rng = random.Random(seed)
+    return [page_lines(page_number, rng) for page_number in range(1, pages + 1)]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, pages):
+    """Write a born-digital PDF (Helvetica text layer) with the given lines per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    font_id = 3 + 2 * len(pages)
+    kids = []
+    for index, lines in enumerate(pages):
+        page_id, content_id = 3 + 2 * index, 4 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        stream = "BT /F1 10 Tf 14 TL 50 760 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output.encode("latin-1")))
+        output += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(output.encode("latin-1"))
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output.encode("latin-1"))
+
+
+def write_scanned_pdf(path, pages, dpi=150, seed=0):
+    """Write an image-only PDF, with light noise, that needs rasterization and vision."""
+    rng = random.Random(seed)
+    images = []
+    for lines in pages:
+        image = Image.new("L", (int(8.5 * dpi), 11 * dpi), 255)
+        draw = ImageDraw.Draw(image)
+        for index, line in enumerate(lines):
+            draw.text((dpi // 2, dpi // 2 + index * dpi // 5), line, fill=0)
+        for _ in range(2000):
+            image.putpixel((rng.randrange(image.width), rng.randrange(image.height)), rng.randint(150, 230))
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def write_corpus(folder, count, pages, variants=("text", "scanned"), seed=0):
+    """Write count documents per variant into folder and return [(variant, path)]."""
+    documents = []
+    for index in range(count):
+        content = document_pages(pages, seed=seed + index)
+        for variant in variants:
+            path = f"{folder}/{variant}_{index}.pdf"
+            if variant == "text":
+                write_text_pdf(path, content)
+            else:
+                write_scanned_pdf(path, content, seed=seed + index)
+            documents.append((variant, path))
+    return documents
@@ -1,12 +1,13 @@
 from langchain_community.document_loaders import DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores.chroma import Chroma
 import os
-import shutil
 from dotenv import load_dotenv
 
+from dataprocessing.embedding_cache import openai_embeddings, upsert_chunks
+from dataprocessing.retrieval import RAG_CHUNK_SIZE, RAG_CHUNK_OVERLAP
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -24,8 +25,8 @@ def load_documents(submission_id):
 
 def split_text(documents: list[Document]):
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=10000,
-        chunk_overlap=100,
+        chunk_size=RAG_CHUNK_SIZE,
+        chunk_overlap=RAG_CHUNK_OVERLAP,
         length_function=len,
         add_start_index=True,
     )
@@ -36,15 +37,10 @@ def split_text(documents: list[Document]):
 
 def save_to_chroma(chunks: list[Document], submission_id):
     chroma_path = f"chroma/{submission_id}"
-    # Clear out the database first.
-    if os.path.exists(chroma_path):
-        shutil.rmtree(chroma_path)
-
-    # Create a new DB from the documents.
-    db = Chroma.from_documents(
-        chunks, OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY), persist_directory=chroma_path
-    )
-    db.persist()
+    # Reuse the existing DB: only new chunks are embedded (and cached embeddings
+    # are reused), chunks of documents removed from the submission are pruned.
+    db = Chroma(persist_directory=chroma_path, embedding_function=openai_embeddings(OPENAI_API_KEY))
+    upsert_chunks(db, chunks, prune=True)
 
 
 def generate_data_store(submission_id):
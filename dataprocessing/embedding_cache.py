@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Embeddings of every chunk ever seen, keyed by model and content hash and
+# shared by the create_database, openai_solution and gemini_solution pipelines.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "chroma/embedding_cache")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Token-length checks need the tiktoken encoding files; chunks are far below the
+# embedding context, so they can be turned off (e.g. offline benchmark runs).
+EMBEDDING_CHECK_CTX_LENGTH = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "true").lower() == "true"
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "models/embedding-001")
+
+
+def cached_embeddings(underlying, namespace):
+    """Wrap an embedding model so only chunks missing from the shared cache are embedded, in batches."""
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=namespace,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        # Queries are embedded differently from documents by some providers (task type): keep them apart.
+        query_embedding_cache=LocalFileStore(os.path.join(EMBEDDING_CACHE_PATH, "queries")),
+        key_encoder="sha256",
+    )
+
+
+# Embedding clients are imported and created on first use, then shared process-wide.
+@functools.cache
+def openai_embeddings(api_key, model=OPENAI_EMBEDDING_MODEL):
+    from langchain_openai import OpenAIEmbeddings
+
+    underlying = OpenAIEmbeddings(model=model, openai_api_key=api_key, chunk_size=EMBEDDING_BATCH_SIZE,
+                                  check_embedding_ctx_length=EMBEDDING_CHECK_CTX_LENGTH)
+    return cached_embeddings(underlying, namespace=f"openai/{model}/")
+
+
+@functools.cache
+def gemini_embeddings(api_key, model=GEMINI_EMBEDDING_MODEL):
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    underlying = GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+    return cached_embeddings(underlying, namespace=f"gemini/{model}/")
+
+
+def chunk_id(chunk):
+    """Content hash used as the vector store id of a chunk."""
+    return hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+
+
+def upsert_chunks(db, chunks, prune=False):
+    """
+    Add to a Chroma store only the chunks it does not hold yet (by content hash).
+    With prune, chunks no longer present in the documents are removed as well.
+    """
+    unique = {}
+    for chunk in chunks:
+        unique.setdefault(chunk_id(chunk), chunk)
+    existing = set(db.get(include=[])["ids"])
+    new_ids = [id_ for id_ in unique if id_ not in existing]
+    if new_ids:
+        db.add_documents([unique[id_] for id_ in new_ids], ids=new_ids)
+    stale_ids = [id_ for id_ in existing if id_ not in unique]
+    if prune and stale_ids:
+        db.delete(ids=stale_ids)
+    print(f"Vector store: {len(new_ids)} new chunk(s), {len(unique) - len(new_ids)} reused"
+          f"{f', {len(stale_ids)} pruned' if prune else ''}.")
+    return db
@@ -1,14 +1,15 @@
 import json
 import os
-from langchain_community.vectorstores.chroma import Chroma
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_openai import OpenAIEmbeddings
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 from datetime import datetime
 
 from dataprocessing.create_database import generate_data_store
+from dataprocessing.embedding_cache import openai_embeddings
+from dataprocessing.retrieval import ChromaRetriever, retrieve_context, template_queries
+from base64_processing import save_output
+from pipeline import map_to_template, openai_chat_model
+from template_store import template_store
 
 load_dotenv()
 
@@ -21,6 +22,9 @@ Answer the question based only on the following context don't give reference:
 Answer the question based on the above context : {question}
 """
 
+# Lowest relevance score (Chroma's, higher is better) of the best chunk for the submission to be answered.
+MIN_RELEVANCE_SCORE = 0.5
+
 
 def generate_content_from_documents(submission_id):
 
@@ -30,18 +34,15 @@ def generate_content_from_documents(submission_id):
     query_text = '''extract all the details in json format '''
     chroma_path = f"./chroma/{submission_id}"
     # Prepare the DB.
-    embedding_function = OpenAIEmbeddings(openai_api_key=openai_api)
-    db = Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
+    retriever = ChromaRetriever(openai_embeddings(openai_api), persist_directory=chroma_path)
 
-    # Search the DB.
-    results = db.similarity_search_with_relevance_scores(query_text, k=3)
-    if len(results) == 0 or results[0][1] < 0.5:
+    # Search the DB with one query per template field group.
+    context_text, results = retrieve_context(retriever, template_queries())
+    if len(results) == 0 or max(score for _doc, score in results) < MIN_RELEVANCE_SCORE:
         return None
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(context=context_text, question=query_text)
-    model = ChatOpenAI(model="gpt-4o")
-    response_text = model.predict(prompt)
+    response_text = openai_chat_model().invoke(prompt).content
     sources = [doc.metadata.get("source", None) for doc, _score in results]
     if not response_text:
         return None
@@ -58,37 +59,14 @@ def generate_content_from_documents(submission_id):
 
 def match_output(submission_id):
     data = generate_content_from_documents(submission_id=submission_id)
-    model = ChatOpenAI(model="gpt-4o", temperature=0.1)
-    with open('../sample/template/template.json') as file:
-        structure = file.read()
-    system_prompt = (f'You are an AI assistant specialized in extracting information from a document.'
-                     f'Please analyze the provided text and extract information in the following JSON format:'
-                     f'replace the <value> with actual value and keep field blank if value is not found.'
-                     f'Return the full structure given below:'
-                     f'{structure}')
+    if not data:
+        return None
     try:
-        response = model.invoke([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Please extract the information from the following text:\n\n{data}")
-        ])
-
-        response_text = response.content
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-
-        if 0 <= json_start < json_end:
-            json_str = response_text[json_start:json_end]
-            parsed_response = json.loads(json_str)
-
-            response_output_path = f"./output/{submission_id}_output.json"
-            os.makedirs(os.path.dirname(response_output_path), exist_ok=True)
-            with open(response_output_path, "w") as output_file:
-                json.dump(parsed_response, output_file, indent=4)
-
-            return parsed_response
-        else:
-            print("No JSON content found in response.")
+        parsed_response = map_to_template(data, template_store.get(), openai_chat_model())
+        if parsed_response is None:
             return None
+        save_output(submission_id, "output.json", parsed_response)
+        return parsed_response
     finally:
         print("process done")
 
@@ -0,0 +1,72 @@
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document
+
+from dataprocessing.retrieval import (build_retriever, retrieve_context, template_queries, RAG_CHUNK_SIZE,
+                                      RAG_CHUNK_OVERLAP)
+
+
+def load_pdf(file_path):
+    """
+    Load a PDF document from the local file system.
+    """
+    try:
+        loader = PyPDFLoader(file_path)
+        documents = loader.load()
+        print(f"Loaded {len(documents)} document(s) from PDF.")
+        return documents
+    except Exception as e:
+        print("Unable to load PDF.", e)
+        return None
+
+
+def split_text(documents: list[Document]):
+    """
+    Split documents into smaller chunks for embedding.
+    """
+    try:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=RAG_CHUNK_SIZE,
+            chunk_overlap=RAG_CHUNK_OVERLAP,
+            length_function=len,
+            add_start_index=True,
+        )
+        chunks = text_splitter.split_documents(documents)
+        print(f"Split into {len(chunks)} chunks.")
+        return chunks
+    except Exception as e:
+        print("Failed to split text.", e)
+        return None
+
+
+def retrieve_document_context(file_path, embedding_function, persist_directory):
+    """
+    Load and chunk a PDF, index it and retrieve the chunks relevant to the
+    template. Returns (context_text, [(document, score)]) or None.
+    """
+    documents = load_pdf(file_path)
+    if not documents:
+        return None
+
+    chunks = split_text(documents)
+    if not chunks:
+        return None
+
+    try:
+        retriever = build_retriever(embedding_function, persist_directory=persist_directory)
+        retriever.add_documents(chunks)
+    except Exception as e:
+        print("Failed to initialize the retriever.", e)
+        return None
+
+    try:
+        # One query per template field group, so every group of fields gets its own top-k chunks.
+        context_text, results = retrieve_context(retriever, template_queries())
+        if not results:
+            print("No relevant chunks found.")
+            return None
+        print(f"Found {len(results)} relevant chunk(s).")
+        return context_text, results
+    except Exception as e:
+        print("Error during similarity search.", e)
+        return None
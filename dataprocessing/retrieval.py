@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from dataprocessing.embedding_cache import chunk_id, upsert_chunks
+from template_store import template_store, field_groups
+
+load_dotenv()
+
+# Chunking and template-driven retrieval settings shared by the RAG pipelines.
+RAG_CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "1500"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "150"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RAG_QUERY_GROUP_BY = os.getenv("RAG_QUERY_GROUP_BY", "prefix").lower()
+RAG_QUERY_GROUP_SIZE = int(os.getenv("RAG_QUERY_GROUP_SIZE", "8"))
+
+# memory: NumPy brute-force search, nothing written to disk (single-document extraction).
+# chroma: persisted Chroma DB under the given directory.
+RETRIEVER_BACKENDS = {"memory", "chroma"}
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "memory").lower()
+
+
+class InMemoryRetriever:
+    """Brute-force cosine top-k search over embeddings held in a NumPy matrix."""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.documents = []
+        self._ids = set()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def add_documents(self, chunks):
+        new_chunks = []
+        for chunk in chunks:
+            id_ = chunk_id(chunk)
+            if id_ not in self._ids:
+                self._ids.add(id_)
+                new_chunks.append(chunk)
+        if not new_chunks:
+            return self
+        vectors = np.asarray(self.embedding_function.embed_documents([chunk.page_content for chunk in new_chunks]),
+                             dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self._vectors = vectors if not self.documents else np.vstack([self._vectors, vectors])
+        self.documents.extend(new_chunks)
+        return self
+
+    def search_by_vectors(self, query_vectors, k=4):
+        """Return, for each query vector, the top-k (document, cosine similarity) pairs."""
+        if not self.documents:
+            return [[] for _ in query_vectors]
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self._vectors.T
+        k = min(k, len(self.documents))
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([(self.documents[index], float(row[index])) for index in top])
+        return results
+
+    def search(self, query, k=4):
+        return self.search_by_vectors([self.embedding_function.embed_query(query)], k)[0]
+
+
+class ChromaRetriever:
+    """Persistent Chroma-backed retriever with the same interface."""
+
+    def __init__(self, embedding_function, persist_directory):
+        from langchain_community.vectorstores import Chroma
+
+        self.embedding_function = embedding_function
+        self.db = Chroma(persist_directory=persist_directory, embedding_function=embedding_function)
+
+    def add_documents(self, chunks):
+        upsert_chunks(self.db, chunks)
+        return self
+
+    def search_by_vectors(self, query_vectors, k=4):
+        # The by-vector search returns distances (lower is closer); convert them the way search() does,
+        # so scores are relevances (higher is better) whatever the call.
+        relevance = self.db._select_relevance_score_fn()
+        return [[(document, relevance(distance))
+                 for document, distance in self.db.similarity_search_by_vector_with_relevance_scores(vector, k=k)]
+                for vector in query_vectors]
+
+    def search(self, query, k=4):
+        return self.db.similarity_search_with_relevance_scores(query, k=k)
+
+
+def build_retriever(embedding_function, persist_directory=None, backend=None):
+    """Return the configured retriever; chroma needs a persist_directory."""
+    backend = (backend or RETRIEVER_BACKEND).lower()
+    if backend not in RETRIEVER_BACKENDS:
+        raise ValueError(f"Unsupported retriever backend: {backend}")
+    if backend == "chroma":
+        os.makedirs(persist_directory, exist_ok=True)
+        return ChromaRetriever(embedding_function, persist_directory)
+    return InMemoryRetriever(embedding_function)
+
+
+def template_queries(fields=None, group_by=RAG_QUERY_GROUP_BY, group_size=RAG_QUERY_GROUP_SIZE):
+    """One retrieval query per template field group, made of the group's field labels."""
+    fields = fields if fields is not None else template_store.get()["fields"]
+    return ["; ".join(field["label"] for field in group) for group in field_groups(fields, group_by, group_size)]
+
+
+def retrieve_context(retriever, queries, k=RAG_TOP_K):
+    """
+    Embed the queries (as queries: the template's are cached after the first
+    document), take the top-k chunks of each, and merge the de-duplicated chunks
+    in document order. Returns (context_text, [(document, score)]), each chunk
+    with its best relevance score over the queries (higher is better).
+    """
+    query_vectors = [retriever.embedding_function.embed_query(query) for query in queries]
+    best = {}
+    for results in retriever.search_by_vectors(query_vectors, k=k):
+        for document, score in results:
+            id_ = chunk_id(document)
+            if id_ not in best or score > best[id_][1]:
+                best[id_] = (document, score)
+    merged = sorted(best.values(), key=lambda item: (str(item[0].metadata.get("source", "")),
+                                                      item[0].metadata.get("page", 0),
+                                                      item[0].metadata.get("start_index", 0)))
+    context_text = "\n\n---\n\n".join(document.page_content for document, _ in merged)
+    return context_text, merged
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "output/cache/extraction_cache.sqlite")
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+
+# Cached stages: the raw fetch_insights output and the final template response.
+INSIGHTS = "insights"
+MAPPED = "mapped"
+
+
+def file_sha256(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Build a cache key from the parts that determine a result (hashes, model, prompt version...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True)
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Content-addressed SQLite cache of extraction results with TTL and size-based eviction."""
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, ttl=EXTRACTION_CACHE_TTL,
+                 max_entries=EXTRACTION_CACHE_MAX_ENTRIES, enabled=EXTRACTION_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._connection = None
+        self._counters = {}
+
+    def _connect(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        return self._connection
+
+    def _count(self, kind, outcome):
+        counters = self._counters.setdefault(kind, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    def get(self, kind, key):
+        """Return the cached value or None on a miss or an expired entry."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT value, created_at FROM cache WHERE kind = ? AND key = ?", (kind, key)
+                ).fetchone()
+                if row is None or (self.ttl and now - row[1] > self.ttl):
+                    self._count(kind, "misses")
+                    return None
+                connection.execute("UPDATE cache SET accessed_at = ? WHERE kind = ? AND key = ?", (now, kind, key))
+                connection.commit()
+                self._count(kind, "hits")
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error reading extraction cache: {e}")
+            return None
+
+    def set(self, kind, key, value):
+        """Store a JSON-serializable value and evict expired or least recently used entries."""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (kind, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (kind, key, json.dumps(value), now, now),
+                )
+                if self.ttl:
+                    connection.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+                if self.max_entries:
+                    connection.execute(
+                        "DELETE FROM cache WHERE rowid IN ("
+                        " SELECT rowid FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+                connection.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Error writing extraction cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = {kind: dict(values) for kind, values in self._counters.items()}
+            entries = 0
+            if self.enabled:
+                try:
+                    entries = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+        return {"enabled": self.enabled, "entries": entries, "max_entries": self.max_entries,
+                "ttl": self.ttl, "counters": counters}
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,61 @@
+"""
+Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+Requests spend most of their time waiting on the LLM APIs, so each worker
+process serves many requests from threads (gthread) rather than one at a time;
+processes are added for the CPU-bound rasterization and encoding.
+"""
+import multiprocessing
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# gthread works with the thread pools used by the pipeline; gevent would need
+# monkey-patching of requests and the executors.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() + 1, 4))))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+# A synchronous extraction of a long document can take minutes; keep the worker
+# timeout above the HTTP read timeout and the vision/mapping retries.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+# In-flight extractions get this long to finish on restart or scale-down.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Import the app once in the master and fork the workers from it.
+preload_app = True
+# Recycle workers now and then to bound memory growth from PDF/image processing
+# (the background jobs of a recycled worker are drained first, see worker_exit).
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+accesslog = "-"
+errorlog = "-"
+
+# LLM packages are imported lazily; each worker loads the default backend's
+# clients in the background right after it starts, so it accepts connections
+# at once and the first request usually finds them ready.
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "true").lower() in {"1", "true", "yes"}
+# Seconds an exiting worker waits for its background jobs; keep it under the
+# graceful timeout, after which the master kills the worker.
+JOB_DRAIN_SECONDS = int(os.getenv("JOB_DRAIN_SECONDS", "90"))
+
+
+def post_worker_init(worker):
+    # Every worker runs a sweeper; a file lock lets only one of them sweep at a time.
+    from storage import storage_sweeper
+    storage_sweeper.start()
+    if WARM_UP_CLIENTS:
+        from pipeline import warm_up
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def worker_exit(server, worker):
+    # Background jobs (threads and the asyncio loop) live in the worker and end with it.
+    from job_queue import job_queue
+    unfinished = job_queue.shutdown(JOB_DRAIN_SECONDS)
+    if unfinished:
+        worker.log.warning("Marked %d unfinished background job(s) as failed: %s", len(unfinished),
+                           ", ".join(unfinished))
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# Load environment variables
+load_dotenv()
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+# Requests in flight from the asyncio pipeline, which waits on the API without holding a thread.
+OPENAI_ASYNC_MAX_CONCURRENCY = int(os.getenv("OPENAI_ASYNC_MAX_CONCURRENCY", "64"))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def retry_after_seconds(response):
+    """Return the delay requested by a Retry-After header, or None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt, base=HTTP_BACKOFF_BASE, cap=HTTP_BACKOFF_MAX):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RateLimiter:
+    """Token bucket limiting the number of requests started per minute (0 disables it)."""
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(requests_per_minute / 60.0, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is available; return 0, or the seconds to wait for the next one."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while wait := self._take():
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        if self.rate <= 0:
+            return
+        while wait := self._take():
+            await asyncio.sleep(wait)
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client with timeouts, retries and a shared concurrency/rate limit."""
+
+    def __init__(self, base_url, headers=None, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                 max_retries=HTTP_MAX_RETRIES, pool_size=HTTP_POOL_SIZE,
+                 max_concurrency=OPENAI_MAX_CONCURRENCY, requests_per_minute=OPENAI_REQUESTS_PER_MINUTE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers or {})
+        self._concurrency = threading.BoundedSemaphore(max_concurrency)
+        self._rate_limiter = RateLimiter(requests_per_minute)
+
+    def _send(self, method, url, stream=False, **kwargs):
+        self._rate_limiter.acquire()
+        self._concurrency.acquire()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, stream=stream, **kwargs)
+        except BaseException:
+            self._concurrency.release()
+            raise
+        if not stream:
+            self._concurrency.release()
+            return response
+
+        # A streamed body is still being received: it holds its concurrency slot until the response is closed.
+        close = response.close
+        released = threading.Event()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if not released.is_set():
+                    released.set()
+                    self._concurrency.release()
+        response.close = close_and_release
+        return response
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying connection errors and retryable statuses with backoff.
+        With stream=True the body is not read; the caller must close the response.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self._send(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"HTTP {method} {url} failed ({e}), retrying.")
+            if attempt == self.max_retries:
+                return response
+            delay = retry_after_seconds(response)
+            if response is not None:
+                response.close()
+            time.sleep(delay if delay is not None else backoff_seconds(attempt))
+        return response
+
+    def post_json(self, path, payload):
+        return self.request("POST", path, json=payload)
+
+
+class AsyncHttpClient:
+    """
+    asyncio counterpart of HttpClient over httpx. The connection pool and the
+    concurrency limit belong to an event loop, so the client must only be used
+    from the shared loop of async_runtime.
+    """
+
+    def __init__(self, base_url, headers=None, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+                 max_retries=HTTP_MAX_RETRIES, max_concurrency=OPENAI_ASYNC_MAX_CONCURRENCY,
+                 rate_limiter=None):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._rate_limiter = rate_limiter or RateLimiter(0)
+        self._client = None
+        self._concurrency = None
+
+    def _session(self):
+        # Created on first use, inside the loop that will drive it.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self.headers, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency))
+            self._concurrency = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _send(self, client, method, url, stream=False, **kwargs):
+        await self._rate_limiter.acquire_async()
+        await self._concurrency.acquire()
+        try:
+            response = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+        except BaseException:
+            self._concurrency.release()
+            raise
+        if not stream:
+            self._concurrency.release()
+            return response
+
+        # As in HttpClient: a streamed body holds its concurrency slot until the response is closed.
+        aclose = response.aclose
+        released = False
+
+        async def aclose_and_release():
+            nonlocal released
+            try:
+                await aclose()
+            finally:
+                if not released:
+                    released = True
+                    self._concurrency.release()
+        response.aclose = aclose_and_release
+        return response
+
+    async def request(self, method, path, stream=False, **kwargs):
+        """
+        Send a request, retrying connection errors and retryable statuses with backoff.
+        With stream=True the body is not read; the caller must close the response (aclose).
+        """
+        client = self._session()
+        url = f"/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = await self._send(client, method, url, stream=stream, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                await response.aread()
+                await response.aclose()
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"HTTP {method} {url} failed ({e!r}), retrying.")
+            if attempt == self.max_retries:
+                return response
+            delay = retry_after_seconds(response)
+            await asyncio.sleep(delay if delay is not None else backoff_seconds(attempt))
+        return response
+
+    async def post_json(self, path, payload):
+        return await self.request("POST", path, json=payload)
+
+
+OPENAI_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+}
+openai_client = HttpClient(OPENAI_BASE_URL, headers=OPENAI_HEADERS)
+# Shares the requests-per-minute budget of the synchronous client.
+async_openai_client = AsyncHttpClient(OPENAI_BASE_URL, headers=OPENAI_HEADERS,
+                                      rate_limiter=openai_client._rate_limiter)
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+from dotenv import load_dotenv
+
+from async_runtime import event_loop
+from metrics import bind
+
+# Load environment variables
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+# Jobs of the asyncio pipeline in flight at once; they wait on the LLM APIs without holding a thread.
+ASYNC_JOB_LIMIT = int(os.getenv("ASYNC_JOB_LIMIT", "256"))
+OUTPUT_FOLDER = "output"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+# Submission folders without a status file (written by versions that did not record synchronous runs).
+STATUS_UNKNOWN = "unknown"
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slot for a new submission."""
+
+
+def _submission_folder(submission_id):
+    # Submission ids are always uuid4 strings, reject anything else so the id
+    # can never be used to walk outside the output folder.
+    return os.path.join(OUTPUT_FOLDER, str(UUID(str(submission_id))))
+
+
+def write_status(submission_id, status, error=None):
+    """Persist the job status next to the submission artifacts."""
+    folder = _submission_folder(submission_id)
+    os.makedirs(folder, exist_ok=True)
+    payload = {"submission_id": str(submission_id), "status": status, "updated_at": time.time()}
+    if error:
+        payload["error"] = error
+    tmp_path = os.path.join(folder, "status.json.tmp")
+    with open(tmp_path, "w") as status_file:
+        json.dump(payload, status_file)
+    os.replace(tmp_path, os.path.join(folder, "status.json"))
+
+
+def _read_json(path):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def read_submission(submission_id):
+    """Return the status and available artifacts of a submission, or None if it is unknown."""
+    try:
+        folder = _submission_folder(submission_id)
+    except ValueError:
+        return None
+    if not os.path.isdir(folder):
+        return None
+
+    status = _read_json(os.path.join(folder, "status.json")) or {"submission_id": str(submission_id)}
+    extracted_data = _read_json(os.path.join(folder, "extracted_data.json"))
+    application_details = _read_json(os.path.join(folder, "output.json"))
+    shards = _read_json(os.path.join(folder, "shards.json"))
+    timings = _read_json(os.path.join(folder, "timings.json"))
+    sources = _read_json(os.path.join(folder, "sources.json"))
+    if "status" not in status:
+        status["status"] = STATUS_COMPLETED if application_details is not None else STATUS_UNKNOWN
+    if extracted_data is not None:
+        status["extracted_data"] = extracted_data
+    if application_details is not None:
+        status["application_details"] = application_details
+    if shards is not None:
+        status["shards"] = shards
+    if timings is not None:
+        status["timings"] = timings
+    if sources is not None:
+        # Batch submissions: per-document outcome and the document each field value came from.
+        status["documents"] = sources["documents"]
+        status["sources"] = sources["fields"]
+    return status
+
+
+class JobQueue:
+    """
+    Bounded worker pool that runs extractions in the background. Coroutine jobs
+    (submit_async) run on the shared event loop instead, up to async_limit at once.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, async_limit=ASYNC_JOB_LIMIT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.async_limit = async_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction")
+        # One slot per running job plus one per queued job; when none are left
+        # the caller gets backpressure instead of an unbounded backlog.
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._async_slots = threading.BoundedSemaphore(async_limit)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._async_in_flight = 0
+        # Ids of the jobs submitted and not finished yet, for shutdown.
+        self._jobs = set()
+        self._closed = False
+
+    def submit(self, job_id, func, *args, **kwargs):
+        if self._closed:
+            raise QueueFullError("The server is restarting, retry the submission.")
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Job queue is full ({self.workers} running, {self.queue_size} queued).")
+        with self._lock:
+            self._in_flight += 1
+            self._jobs.add(job_id)
+        try:
+            write_status(job_id, STATUS_QUEUED)
+            # The job keeps recording its spans into the submitting request's trace.
+            self._executor.submit(bind(self._run), job_id, func, args, kwargs)
+        except Exception:
+            self._release(job_id)
+            raise
+
+    def submit_async(self, job_id, func, *args, **kwargs):
+        """Run the coroutine function func as a job on the shared event loop."""
+        if self._closed:
+            raise QueueFullError("The server is restarting, retry the submission.")
+        if not self._async_slots.acquire(blocking=False):
+            raise QueueFullError(f"Too many asyncio jobs in flight ({self.async_limit}).")
+        with self._lock:
+            self._async_in_flight += 1
+            self._jobs.add(job_id)
+        try:
+            write_status(job_id, STATUS_QUEUED)
+            event_loop.submit(self._run_async(job_id, func, args, kwargs))
+        except Exception:
+            self._release_async(job_id)
+            raise
+
+    def _release(self, job_id):
+        with self._lock:
+            self._in_flight -= 1
+            self._jobs.discard(job_id)
+            self._idle.notify_all()
+        self._slots.release()
+
+    def _release_async(self, job_id):
+        with self._lock:
+            self._async_in_flight -= 1
+            self._jobs.discard(job_id)
+            self._idle.notify_all()
+        self._async_slots.release()
+
+    def _finish(self, job_id, result):
+        if result:
+            write_status(job_id, STATUS_COMPLETED)
+        else:
+            write_status(job_id, STATUS_FAILED, error="Error extracting data from the document.")
+
+    def _fail(self, job_id, error):
+        print(f"Error processing submission {job_id}: {error}")
+        write_status(job_id, STATUS_FAILED, error=str(error))
+
+    def run(self, job_id, func, *args, **kwargs):
+        """Run a job in the calling thread (a synchronous request), recording its status like a queued job's."""
+        write_status(job_id, STATUS_RUNNING)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._fail(job_id, e)
+            raise
+        self._finish(job_id, result)
+        return result
+
+    async def run_async(self, job_id, func, *args, **kwargs):
+        """asyncio version of run, for a coroutine function; the status is written off the event loop."""
+        await asyncio.to_thread(write_status, job_id, STATUS_RUNNING)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            await asyncio.to_thread(self._fail, job_id, e)
+            raise
+        await asyncio.to_thread(self._finish, job_id, result)
+        return result
+
+    def _run(self, job_id, func, args, kwargs):
+        try:
+            write_status(job_id, STATUS_RUNNING)
+            self._finish(job_id, func(*args, **kwargs))
+        except Exception as e:
+            self._fail(job_id, e)
+        finally:
+            self._release(job_id)
+
+    async def _run_async(self, job_id, func, args, kwargs):
+        try:
+            # Status files are written off the event loop, as in run_async.
+            await asyncio.to_thread(write_status, job_id, STATUS_RUNNING)
+            result = await func(*args, **kwargs)
+            await asyncio.to_thread(self._finish, job_id, result)
+        except Exception as e:
+            await asyncio.to_thread(self._fail, job_id, e)
+        finally:
+            self._release_async(job_id)
+
+    def shutdown(self, timeout):
+        """
+        Stop taking jobs and wait up to timeout seconds for those in flight. The
+        jobs left die with the process: they are marked failed, so their status
+        does not stay queued or running. Returns their ids.
+        """
+        with self._idle:
+            self._closed = True
+            self._idle.wait_for(lambda: not self._jobs, timeout)
+            unfinished = list(self._jobs)
+        for job_id in unfinished:
+            write_status(job_id, STATUS_FAILED, error="The server restarted before the extraction finished.")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return unfinished
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+            async_in_flight = self._async_in_flight
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": min(in_flight, self.workers),
+            "queued": max(in_flight - self.workers, 0),
+            "async_running": async_in_flight,
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,108 @@
+import json
+
+from metrics import span, JSON_PARSE
+
+
+class JsonStreamParser:
+    """
+    Incremental, tolerant parser of the first JSON object in an LLM answer.
+
+    Text can be fed as it is streamed. Anything before the first '{' (prose,
+    code fences) and after its matching '}' is ignored, trailing commas are
+    dropped, mismatched closing brackets are corrected, and a truncated object is
+    cut back to its last complete member and closed.
+    """
+
+    def __init__(self):
+        self._out = []
+        self._stack = []
+        # (length of _out, closers) at each point where a truncated object can be cut and closed.
+        self._cuts = []
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        self.done = False
+
+    def _strip_trailing_comma(self):
+        while self._out and self._out[-1].isspace():
+            self._out.pop()
+        if self._out and self._out[-1] == ',':
+            self._out.pop()
+
+    def feed(self, text):
+        for char in text:
+            if self.done:
+                return
+            if not self._started:
+                if char != '{':
+                    continue
+                self._started = True
+            if self._in_string:
+                self._out.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append('}' if char == '{' else ']')
+                self._out.append(char)
+                self._cuts.append((len(self._out), ''.join(reversed(self._stack))))
+                continue
+            elif char in '}]':
+                self._strip_trailing_comma()
+                self._out.append(self._stack.pop())
+                self.done = not self._stack
+                continue
+            elif char == ',':
+                self._strip_trailing_comma()
+                self._cuts.append((len(self._out), ''.join(reversed(self._stack))))
+            self._out.append(char)
+
+    def result(self):
+        """Return (parsed object or None, truncated) for the text fed so far."""
+        if not self._started:
+            return None, False
+        text = ''.join(self._out)
+        # strict=False accepts raw newlines and tabs inside strings.
+        if self.done:
+            return json.loads(text, strict=False), False
+        # Truncated: keep the last member only when it ends with a complete string or
+        # container (a trailing number or literal may be cut), otherwise cut it off.
+        candidates = []
+        last = text.rstrip()[-1:]
+        if not self._in_string and last in ('"', '}', ']'):
+            candidates.append(text + ''.join(reversed(self._stack)))
+        candidates.extend(text[:length].rstrip().rstrip(',') + closers for length, closers in reversed(self._cuts))
+        for candidate in candidates:
+            try:
+                return json.loads(candidate, strict=False), True
+            except ValueError:
+                continue
+        return None, True
+
+
+def finish_json(parser, response_bytes=0):
+    """Return (object or None, truncated) from a parser fed with a whole (possibly streamed) answer."""
+    with span(JSON_PARSE, response_bytes=response_bytes):
+        try:
+            data, truncated = parser.result()
+        except ValueError as e:
+            print(f"Invalid JSON content in response: {e}")
+            return None, False
+    if data is None:
+        print("No JSON content found in response.")
+    elif truncated:
+        print("Truncated JSON response, kept the complete members.")
+    return data, truncated
+
+
+def parse_json_response(response_text):
+    """Parse the JSON object of an LLM answer; return (object or None, truncated)."""
+    parser = JsonStreamParser()
+    parser.feed(response_text)
+    return finish_json(parser, len(response_text))
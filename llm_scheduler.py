@@ -0,0 +1,308 @@
+import asyncio
+import base64
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from io import BytesIO
+
+from dotenv import load_dotenv
+
+from metrics import current_trace, span, LLM_QUEUE
+
+# Load environment variables
+load_dotenv()
+
+# Token and request budgets per minute of each provider, for this process (0 disables the budget).
+OPENAI_TPM_BUDGET = int(os.getenv("OPENAI_TPM_BUDGET", "0"))
+OPENAI_RPM_BUDGET = int(os.getenv("OPENAI_RPM_BUDGET", "0"))
+GEMINI_TPM_BUDGET = int(os.getenv("GEMINI_TPM_BUDGET", "0"))
+GEMINI_RPM_BUDGET = int(os.getenv("GEMINI_RPM_BUDGET", "0"))
+# Share of the budgets the bulk lane leaves free, so interactive calls are admitted without waiting.
+LLM_INTERACTIVE_RESERVE = float(os.getenv("LLM_INTERACTIVE_RESERVE", "0.25"))
+# Seconds of budget that can be spent in one burst. Providers enforce their limits over short windows;
+# staying under them leaves room for calls that are admitted together but sent late.
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "5"))
+
+# Priority lanes, highest first.
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Tokens billed for an image part that cannot be decoded: a letter page at 200 dpi (4 tiles).
+DEFAULT_IMAGE_TOKENS = 765
+# Completion tokens expected per field of a mapping call (id, value and JSON punctuation).
+MAPPING_TOKENS_PER_FIELD = 30
+
+_current_lane = contextvars.ContextVar("llm_lane", default=INTERACTIVE)
+
+
+def current_lane():
+    return _current_lane.get()
+
+
+@contextmanager
+def priority_lane(lane):
+    """Send the LLM calls of the enclosed code (and of the jobs it submits) through the given lane."""
+    if lane not in LANES:
+        raise ValueError(f"Unsupported priority: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield lane
+    finally:
+        _current_lane.reset(token)
+
+
+def estimate_text_tokens(text):
+    """Rough token count of a text: 4 characters per token."""
+    return math.ceil(len(text or "") / 4)
+
+
+def estimate_image_tokens(url, detail="auto"):
+    """
+    Tokens billed for an image part, following the tile formula of the OpenAI
+    vision models: the image is fit in 2048x2048, its shortest side scaled down
+    to 768, and each 512px tile costs 170 tokens on top of a base of 85.
+    """
+    if detail == "low":
+        return 85
+    try:
+        from PIL import Image
+
+        # The header is enough to read the size, decode only the start of the data URL.
+        encoded = url.split(",", 1)[1][:65536]
+        with Image.open(BytesIO(base64.b64decode(encoded[:len(encoded) // 4 * 4]))) as image:
+            width, height = image.size
+    except Exception:
+        return DEFAULT_IMAGE_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def estimate_content_tokens(content):
+    """Tokens of a message content: a string, or a list of text and image_url parts."""
+    if isinstance(content, str):
+        return estimate_text_tokens(content)
+    tokens = 0
+    for part in content or []:
+        if part.get("type") == "image_url":
+            image = part.get("image_url") or {}
+            tokens += estimate_image_tokens(image.get("url", ""), image.get("detail", "auto"))
+        else:
+            tokens += estimate_text_tokens(part.get("text"))
+    return tokens
+
+
+def estimate_chat_tokens(messages, max_tokens=0):
+    """Token cost of a chat completion: its prompt (4 tokens of overhead per message) and expected completion."""
+    prompt = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else message.content
+        prompt += 4 + estimate_content_tokens(content)
+    return prompt + max_tokens
+
+
+class Ticket:
+    """One LLM call waiting for, then holding, its share of the budget."""
+
+    def __init__(self, cost, lane, source):
+        self.cost = cost
+        self.lane = lane
+        self.source = source
+        self.granted = False
+        self.used = None
+        self._grant = None
+
+    def settle(self, counters):
+        """Record the tokens the call actually used, from its span counters."""
+        used = (counters.get("prompt_tokens") or 0) + (counters.get("completion_tokens") or 0)
+        if used:
+            self.used = used
+
+
+class TokenScheduler:
+    """
+    Admits the LLM calls of one provider under its tokens and requests per
+    minute budgets, before they are sent. Each call is charged its estimated
+    token cost up front, and the tokens it used beyond the estimate when it
+    completes.
+
+    Waiting calls are queued per priority lane and, within a lane, per source
+    (the submission id), so interactive calls go first and a large batch does
+    not hold up other submissions: sources take turns, one call each. The bulk
+    lane only spends the budget above LLM_INTERACTIVE_RESERVE, which keeps
+    headroom for interactive calls arriving while a backfill runs.
+
+    A dispatcher thread, started on first use, grants the calls; both threads
+    and the asyncio pipeline wait on it. A call costing more than the burst
+    capacity is admitted once the bucket is full.
+    """
+
+    def __init__(self, name, tokens_per_minute=0, requests_per_minute=0, reserve=LLM_INTERACTIVE_RESERVE,
+                 burst_seconds=LLM_BURST_SECONDS):
+        self.name = name
+        self.enabled = tokens_per_minute > 0 or requests_per_minute > 0
+        self.reserve = reserve
+        # Each budget is a bucket [capacity, refill per second]; a disabled budget is never exhausted.
+        self._buckets = {}
+        for key, per_minute in (("tokens", tokens_per_minute), ("requests", requests_per_minute)):
+            if per_minute > 0:
+                self._buckets[key] = [max(per_minute * burst_seconds / 60, 1.0), per_minute / 60]
+        self._available = {key: capacity for key, (capacity, _) in self._buckets.items()}
+        self._updated = time.monotonic()
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._condition = threading.Condition()
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        for key, (capacity, rate) in self._buckets.items():
+            self._available[key] = min(capacity, self._available[key] + (now - self._updated) * rate)
+        self._updated = now
+
+    def _wait_seconds(self, ticket):
+        """Seconds until the budgets can admit the ticket (0 when they can now)."""
+        wait = 0.0
+        for key, (capacity, rate) in self._buckets.items():
+            need = ticket.cost if key == "tokens" else 1
+            if ticket.lane == BULK:
+                need += self.reserve * capacity
+            need = min(need, capacity)
+            wait = max(wait, (need - self._available[key]) / rate)
+        return wait
+
+    def _next_ticket(self):
+        for lane in LANES:
+            for tickets in self._queues[lane].values():
+                return tickets[0]
+        return None
+
+    def _dispatch(self):
+        with self._condition:
+            while True:
+                ticket = self._next_ticket()
+                if ticket is None:
+                    self._condition.wait()
+                    continue
+                self._refill()
+                wait = self._wait_seconds(ticket)
+                if wait > 0:
+                    # Woken early when a ticket is queued or withdrawn, or a call refunded.
+                    self._condition.wait(wait)
+                    continue
+                if "tokens" in self._available:
+                    self._available["tokens"] -= ticket.cost
+                if "requests" in self._available:
+                    self._available["requests"] -= 1
+                queue = self._queues[ticket.lane]
+                queue[ticket.source].popleft()
+                if queue[ticket.source]:
+                    queue.move_to_end(ticket.source)
+                else:
+                    del queue[ticket.source]
+                ticket.granted = True
+                ticket._grant()
+
+    def _enqueue(self, ticket, grant):
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name=f"llm-scheduler-{self.name}",
+                                                    daemon=True)
+                self._dispatcher.start()
+            ticket._grant = grant
+            self._queues[ticket.lane].setdefault(ticket.source, deque()).append(ticket)
+            self._condition.notify()
+
+    def _withdraw(self, ticket):
+        """Remove a ticket whose caller gave up waiting, or refund it if it was granted meanwhile."""
+        with self._condition:
+            if ticket.granted:
+                self._refund(ticket)
+                return
+            queue = self._queues[ticket.lane]
+            queue[ticket.source].remove(ticket)
+            if not queue[ticket.source]:
+                del queue[ticket.source]
+            self._condition.notify()
+
+    def _settle(self, ticket):
+        """Charge the tokens a call used beyond its estimate."""
+        # Providers count max_tokens against the limit when they accept a request, so an
+        # overestimate is not given back; an underestimate would otherwise overrun the budget.
+        if ticket.used is None or ticket.used <= ticket.cost or "tokens" not in self._available:
+            return
+        with self._condition:
+            self._refill()
+            self._available["tokens"] -= ticket.used - ticket.cost
+
+    def _refund(self, ticket):
+        """Give back the budget of a granted call that was never sent."""
+        with self._condition:
+            self._refill()
+            for key, (capacity, _) in self._buckets.items():
+                charged = ticket.cost if key == "tokens" else 1
+                self._available[key] = min(capacity, self._available[key] + charged)
+            self._condition.notify()
+
+    def _ticket(self, cost):
+        trace = current_trace()
+        return Ticket(max(int(cost), 1), current_lane(), trace.submission_id if trace is not None else "default")
+
+    @contextmanager
+    def admit(self, cost):
+        """Wait until the call of the given estimated token cost fits the budgets; yields its Ticket."""
+        ticket = self._ticket(cost)
+        if not self.enabled:
+            yield ticket
+            return
+        granted = threading.Event()
+        with span(LLM_QUEUE):
+            self._enqueue(ticket, granted.set)
+            granted.wait()
+        try:
+            yield ticket
+        finally:
+            self._settle(ticket)
+
+    @asynccontextmanager
+    async def admit_async(self, cost):
+        """asyncio version of admit; the event loop keeps running while the call waits."""
+        ticket = self._ticket(cost)
+        if not self.enabled:
+            yield ticket
+            return
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+        with span(LLM_QUEUE):
+            self._enqueue(ticket, grant)
+            try:
+                await granted
+            except asyncio.CancelledError:
+                self._withdraw(ticket)
+                raise
+        try:
+            yield ticket
+        finally:
+            self._settle(ticket)
+
+    def stats(self):
+        """Calls waiting per lane and budget left in the bucket, for /metrics."""
+        with self._condition:
+            self._refill()
+            stats = {f"waiting_{lane}": sum(len(tickets) for tickets in self._queues[lane].values())
+                     for lane in LANES}
+            stats.update({f"available_{key}": round(value, 1) for key, value in self._available.items()})
+        return stats
+
+
+openai_scheduler = TokenScheduler("openai", OPENAI_TPM_BUDGET, OPENAI_RPM_BUDGET)
+gemini_scheduler = TokenScheduler("gemini", GEMINI_TPM_BUDGET, GEMINI_RPM_BUDGET)
@@ -0,0 +1,152 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages instrumented with spans.
+UPLOAD_SAVE = "upload_save"
+RASTERIZE = "rasterize"
+ENCODE = "encode"
+LLM_QUEUE = "llm_queue"
+VISION_CALL = "vision_call"
+RETRIEVAL = "retrieval"
+MAPPING_CALL = "mapping_call"
+JSON_PARSE = "json_parse"
+OUTPUT_WRITE = "output_write"
+
+# Counters a span can carry besides its duration.
+COUNTERS = ("pages", "request_bytes", "response_bytes", "prompt_tokens", "completion_tokens")
+# Upper bounds (seconds) of the stage duration histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Spans recorded for one submission, summarized per stage for the API response."""
+
+    def __init__(self, submission_id):
+        self.submission_id = str(submission_id)
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds, counters, ok=True):
+        with self._lock:
+            summary = self._stages.setdefault(stage, {"count": 0, "errors": 0, "seconds": 0.0,
+                                                      "max_seconds": 0.0})
+            summary["count"] += 1
+            summary["errors"] += 0 if ok else 1
+            summary["seconds"] += seconds
+            summary["max_seconds"] = max(summary["max_seconds"], seconds)
+            for name in COUNTERS:
+                if counters.get(name):
+                    summary[name] = summary.get(name, 0) + counters[name]
+
+    def summary(self):
+        """
+        Per-stage span count, summed and longest duration and counters. Stages run
+        concurrently (page encoding, vision shards, mapping groups), so summed
+        seconds can exceed total_seconds.
+        """
+        with self._lock:
+            stages = {stage: {**summary, "seconds": round(summary["seconds"], 4),
+                              "max_seconds": round(summary["max_seconds"], 4)}
+                      for stage, summary in self._stages.items()}
+        return {"total_seconds": round(time.perf_counter() - self.started, 4), "stages": stages}
+
+
+class MetricsRegistry:
+    """Process-wide stage metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage, seconds, counters, ok=True):
+        with self._lock:
+            stats = self._stages.setdefault(stage, {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                                                    "errors": 0, **{name: 0 for name in COUNTERS}})
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats["buckets"][index] += 1
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["errors"] += 0 if ok else 1
+            for name in COUNTERS:
+                stats[name] += counters.get(name) or 0
+
+    def render(self, gauges=None):
+        """Return the metrics as Prometheus text, followed by the given {name: (help, value)} gauges."""
+        with self._lock:
+            stages = {stage: {**stats, "buckets": list(stats["buckets"])} for stage, stats in self._stages.items()}
+        lines = ["# HELP herald_stage_seconds Duration of pipeline stages.",
+                 "# TYPE herald_stage_seconds histogram"]
+        for stage, stats in sorted(stages.items()):
+            for bound, count in zip(self.buckets, stats["buckets"]):
+                lines.append(f'herald_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'herald_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'herald_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+            lines.append(f'herald_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for name, help_text in (("errors", "Pipeline stages that raised."),
+                                ("pages", "Pages processed by pipeline stages."),
+                                ("request_bytes", "Bytes sent by pipeline stages."),
+                                ("response_bytes", "Bytes received or written by pipeline stages."),
+                                ("prompt_tokens", "LLM prompt tokens used by pipeline stages."),
+                                ("completion_tokens", "LLM completion tokens used by pipeline stages.")):
+            lines.append(f"# HELP herald_stage_{name}_total {help_text}")
+            lines.append(f"# TYPE herald_stage_{name}_total counter")
+            for stage, stats in sorted(stages.items()):
+                lines.append(f'herald_stage_{name}_total{{stage="{stage}"}} {stats[name]}')
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(submission_id):
+    """Collect the spans of the enclosed code (and of the functions it binds) into a new Trace."""
+    trace = Trace(submission_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def bind(func):
+    """Wrap func so it records its spans into the caller's trace when run on another thread."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+@contextmanager
+def span(stage, **counters):
+    """
+    Time the enclosed block as one span of the stage. Yields the counters dict so
+    sizes and token usage known only at the end can be filled in.
+    """
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield counters
+        ok = True
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe(stage, seconds, counters, ok)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record(stage, seconds, counters, ok)
@@ -0,0 +1,534 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from base64_processing import (afetch_image_insights, afetch_insights, fetch_image_insights, fetch_insights,
+                               insights_cache_key, notify, save_output, DEFAULT_IMAGE_PROFILE, PROMPT_VERSION)
+from dataprocessing.embedding_cache import (openai_embeddings, gemini_embeddings, GEMINI_EMBEDDING_MODEL,
+                                            OPENAI_EMBEDDING_MODEL)
+from dataprocessing.retrieval import (RAG_CHUNK_OVERLAP, RAG_CHUNK_SIZE, RAG_QUERY_GROUP_BY, RAG_QUERY_GROUP_SIZE,
+                                      RAG_TOP_K, RETRIEVER_BACKEND)
+from extraction_cache import extraction_cache, file_sha256, make_key, MAPPED
+from http_client import HTTP_MAX_RETRIES, HTTP_READ_TIMEOUT
+from llm_json import finish_json, parse_json_response, JsonStreamParser
+from llm_scheduler import estimate_chat_tokens, gemini_scheduler, openai_scheduler, MAPPING_TOKENS_PER_FIELD
+from metrics import bind, current_trace, span, MAPPING_CALL, RETRIEVAL
+from template_store import (template_store, build_template_response, compact_schema, field_groups,
+                            merge_document_values, response_values, stitch_group_values, validate_values)
+from text_layer import EXTRACTION_MODE
+from upload_validation import detect_content_type, IMAGE, PDF, TEXT
+
+# Load environment variables
+load_dotenv()
+openai_api_key = os.getenv('OPENAI_API_KEY')
+google_api_key = os.getenv('GEMINI_API_KEY')
+
+MAPPING_MODEL = os.getenv('MAPPING_MODEL', 'gpt-4o')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+DEFAULT_BACKEND = os.getenv('EXTRACTION_BACKEND', 'openai-vision')
+# Template fields can be split into groups mapped by concurrent calls: none, count or prefix.
+MAPPING_GROUP_BY = os.getenv('MAPPING_GROUP_BY', 'none').lower()
+MAPPING_GROUP_SIZE = int(os.getenv('MAPPING_GROUP_SIZE', '20'))
+MAPPING_CONCURRENCY = int(os.getenv('MAPPING_CONCURRENCY', '4'))
+# Follow-up calls per field group asking again only for the fields whose values failed validation.
+MAPPING_REASK_ATTEMPTS = int(os.getenv('MAPPING_REASK_ATTEMPTS', '1'))
+# Documents of one batch submission processed at the same time.
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '3'))
+
+
+# Chat models are created on first use (the LangChain provider packages take
+# most of the import time) and then shared by all requests, keeping their
+# connection pools warm. They use the read timeout and retries of http_client
+# instead of the SDK defaults (10 minute timeout).
+@functools.cache
+def openai_chat_model():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=MAPPING_MODEL, temperature=0.1, stream_usage=True, timeout=HTTP_READ_TIMEOUT,
+                      max_retries=HTTP_MAX_RETRIES)
+
+
+@functools.cache
+def gemini_chat_model():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=google_api_key, temperature=0,
+                                  timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES)
+
+
+def mapping_messages(data, fields, feedback=None, schema=None):
+    """
+    Build the chat messages asking for the values of the given fields; return (messages, request bytes).
+    schema is the fields' compact schema when it is already rendered (the template's cached one).
+    """
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    # The model only sees the compact id/label/type schema and answers with an
+    # id -> value map; the full template response is rebuilt locally.
+    system_prompt = (f'You are an AI assistant specialized in extracting information from a document.'
+                     f'Please analyze the provided text and return a JSON object mapping each field id listed '
+                     f'below to the value found in the document, formatted according to the field type. '
+                     f'Omit fields whose value is not found.\n'
+                     f'Fields (id | label | type):\n'
+                     f'{schema or compact_schema(fields)}')
+    if feedback:
+        rejected = "\n".join(f"{field_id}: {reason}" for field_id, reason in feedback.items())
+        system_prompt += (f'\nThe values previously returned for these fields were rejected; answer again '
+                          f'in the format of the field type:\n{rejected}')
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=f"Please extract the information from the following text:\n\n{data}")
+    ]
+    return messages, len(system_prompt.encode()) + len(str(data).encode())
+
+
+class StreamedMapping:
+    """Accumulates the chunks of a streamed mapping answer, parsing and reporting it as it is generated."""
+
+    def __init__(self, progress, group, report_every=500):
+        self.progress = progress
+        self.group = group
+        self.report_every = report_every
+        self.parser = JsonStreamParser()
+        self.parts = []
+        self.usage = None
+        self.received = self.reported = 0
+
+    def add(self, chunk):
+        self.parts.append(chunk.content)
+        self.parser.feed(chunk.content)
+        self.usage = chunk.usage_metadata or self.usage
+        self.received += len(chunk.content)
+        if self.received - self.reported >= self.report_every:
+            notify(self.progress, "mapping_progress", group=self.group, characters=self.received)
+            self.reported = self.received
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def record_mapping_usage(counters, response_text, usage):
+    counters["response_bytes"] = len(response_text.encode())
+    counters["prompt_tokens"] = (usage or {}).get("input_tokens", 0)
+    counters["completion_tokens"] = (usage or {}).get("output_tokens", 0)
+
+
+def mapping_cost(messages, fields):
+    """Estimated token cost of a mapping call: its prompt and a short answer per field."""
+    return estimate_chat_tokens(messages, MAPPING_TOKENS_PER_FIELD * len(fields))
+
+
+def map_fields(data, fields, model, progress=None, group=0, feedback=None, scheduler=openai_scheduler,
+               schema=None):
+    """
+    Ask the mapping model for the values of the given template fields; return (id -> value map or None,
+    truncated). With a progress callback the completion is streamed, parsed and reported as it is
+    generated. feedback maps field ids to the reason their previous value was rejected. The call first
+    waits for the token budget of the model's scheduler.
+    """
+    messages, request_bytes = mapping_messages(data, fields, feedback, schema)
+    with scheduler.admit(mapping_cost(messages, fields)) as ticket, \
+            span(MAPPING_CALL, request_bytes=request_bytes) as counters:
+        if progress is not None:
+            stream = StreamedMapping(progress, group)
+            for chunk in model.stream(messages):
+                stream.add(chunk)
+            record_mapping_usage(counters, stream.text(), stream.usage)
+        else:
+            message = model.invoke(messages)
+            record_mapping_usage(counters, message.content, message.usage_metadata)
+        ticket.settle(counters)
+    if progress is not None:
+        return finish_json(stream.parser, len(stream.text()))
+    return parse_json_response(message.content)
+
+
+async def amap_fields(data, fields, model, progress=None, group=0, feedback=None, scheduler=openai_scheduler,
+                      schema=None):
+    """asyncio version of map_fields, using the model's ainvoke/astream."""
+    messages, request_bytes = mapping_messages(data, fields, feedback, schema)
+    async with scheduler.admit_async(mapping_cost(messages, fields)) as ticket:
+        with span(MAPPING_CALL, request_bytes=request_bytes) as counters:
+            if progress is not None:
+                stream = StreamedMapping(progress, group)
+                async for chunk in model.astream(messages):
+                    stream.add(chunk)
+                record_mapping_usage(counters, stream.text(), stream.usage)
+            else:
+                message = await model.ainvoke(messages)
+                record_mapping_usage(counters, message.content, message.usage_metadata)
+            ticket.settle(counters)
+    if progress is not None:
+        return finish_json(stream.parser, len(stream.text()))
+    return parse_json_response(message.content)
+
+
+def group_mapping(fields):
+    """
+    Drive the mapping of one field group and its re-asks. The generator yields the
+    (fields, feedback) of each mapping call to make and is sent back the call's
+    (values, truncated) answer; it returns (valid values, or None when no answer
+    could be parsed, reasked count, id -> reason of the values still invalid). The
+    thread and asyncio pipelines only differ in how they make the calls.
+    """
+    valid = None
+    failures = {}
+    reasked = 0
+    values, truncated = yield fields, None
+    for attempt in range(MAPPING_REASK_ATTEMPTS + 1):
+        if values is None:
+            # No JSON could be parsed from the answer: every field asked failed.
+            failures = {field["id"]: "the previous answer was not a valid JSON object" for field in fields}
+        else:
+            answer_valid, failures = validate_values(fields, values)
+            valid = {**(valid or {}), **answer_valid}
+            # Fields missing from a truncated answer may have been cut off rather than not found.
+            if truncated:
+                failures.update({field["id"]: "missing from the previous answer, which was cut off"
+                                 for field in fields if field["id"] not in values and field["id"] not in failures})
+        if not failures or attempt == MAPPING_REASK_ATTEMPTS:
+            break
+        # Only the failed fields are asked again, not the whole group.
+        fields = [field for field in fields if field["id"] in failures]
+        reasked += len(fields)
+        values, truncated = yield fields, failures
+    return valid, reasked, failures
+
+
+def group_schema(template, groups, fields):
+    """Schema of a mapping call: the template's cached one when the call asks for every field, else None."""
+    return template["schema"] if len(groups) == 1 and fields is groups[0] else None
+
+
+def group_mapped(progress, index, groups, outcome):
+    """Report the outcome of a group_mapping run and return the group's values (None when it failed)."""
+    valid, reasked, failures = outcome
+    if failures:
+        print(f"Dropping invalid values of group {index}: {failures}")
+    notify(progress, "group_mapped", group=index, groups=len(groups), fields=len(groups[index]),
+           ok=valid is not None, reasked=reasked, invalid=len(failures))
+    return valid
+
+
+def map_to_template(data, template, model, progress=None, scheduler=openai_scheduler):
+    """Map extracted data onto the template, one concurrent call per field group; return the response or None."""
+    groups = field_groups(template["fields"], MAPPING_GROUP_BY, MAPPING_GROUP_SIZE)
+
+    # Each field group is mapped by its own concurrent call with the same extracted data.
+    def map_group(index):
+        mapping = group_mapping(groups[index])
+        fields, feedback = next(mapping)
+        try:
+            while True:
+                answer = map_fields(data, fields, model, progress=progress, group=index, feedback=feedback,
+                                    scheduler=scheduler, schema=group_schema(template, groups, fields))
+                fields, feedback = mapping.send(answer)
+        except StopIteration as done:
+            return group_mapped(progress, index, groups, done.value)
+
+    with ThreadPoolExecutor(max_workers=min(MAPPING_CONCURRENCY, len(groups))) as executor:
+        group_values = list(executor.map(bind(map_group), range(len(groups))))
+    return build_mapped_response(template, groups, group_values)
+
+
+async def amap_to_template(data, template, model, progress=None, scheduler=openai_scheduler):
+    """asyncio version of map_to_template; at most MAPPING_CONCURRENCY groups are mapped at a time."""
+    groups = field_groups(template["fields"], MAPPING_GROUP_BY, MAPPING_GROUP_SIZE)
+    limit = asyncio.Semaphore(MAPPING_CONCURRENCY)
+
+    async def map_group(index):
+        mapping = group_mapping(groups[index])
+        fields, feedback = next(mapping)
+        try:
+            while True:
+                async with limit:
+                    answer = await amap_fields(data, fields, model, progress=progress, group=index,
+                                               feedback=feedback, scheduler=scheduler,
+                                               schema=group_schema(template, groups, fields))
+                fields, feedback = mapping.send(answer)
+        except StopIteration as done:
+            return group_mapped(progress, index, groups, done.value)
+
+    group_values = await asyncio.gather(*(map_group(index) for index in range(len(groups))))
+    return build_mapped_response(template, groups, group_values)
+
+
+def build_mapped_response(template, groups, group_values):
+    if any(values is None for values in group_values):
+        return None
+    return build_template_response(template["template"],
+                                   stitch_group_values(template["fields"], groups, group_values))
+
+
+def extract_with_vision(file_path, submission_id, image_profile=None, pdf_hash=None, mode=None, progress=None):
+    """Extractor stage: send the pages (text layer or images) to the vision model."""
+    return fetch_insights(pdf_path=file_path, submission_id=submission_id, image_profile=image_profile,
+                          pdf_hash=pdf_hash, mode=mode, progress=progress)
+
+
+async def aextract_with_vision(file_path, submission_id, image_profile=None, pdf_hash=None, mode=None,
+                               progress=None):
+    return await afetch_insights(pdf_path=file_path, submission_id=submission_id, image_profile=image_profile,
+                                 pdf_hash=pdf_hash, mode=mode, progress=progress)
+
+
+def extract_text_file(file_path, submission_id, progress=None, **options):
+    """Extractor stage for text uploads: the text goes straight to the mapping call."""
+    with open(file_path, encoding="utf-8", errors="replace") as text_file:
+        data = text_file.read()
+    notify(progress, "pages_prepared", pages=1, text_pages=1, image_pages=0)
+    return data
+
+
+def rag_extractor(name, embeddings_factory):
+    """Build an extractor stage that retrieves the template-relevant chunks of the document."""
+    def extract(file_path, submission_id, progress=None, **options):
+        from dataprocessing.rag import retrieve_document_context
+
+        file_name_no_ext = os.path.splitext(os.path.basename(file_path))[0]
+        with span(RETRIEVAL) as counters:
+            retrieved = retrieve_document_context(
+                file_path, embeddings_factory(), persist_directory=f"./chroma/{submission_id}/{name}/{file_name_no_ext}")
+            if retrieved is None:
+                return None
+            context_text, results = retrieved
+            counters["response_bytes"] = len(context_text.encode())
+        save_output(submission_id, "extracted_data.json", {
+            "context": context_text,
+            "sources": [{"source": doc.metadata.get("source"), "page": doc.metadata.get("page"), "score": score}
+                        for doc, score in results],
+        })
+        notify(progress, "context_retrieved", chunks=len(results), characters=len(context_text))
+        return context_text
+    return extract
+
+
+def vision_extractor_key(pdf_hash, mode, image_profile):
+    """Key of the vision extraction of a document: the one of its cached insights."""
+    return insights_cache_key(None, pdf_hash, mode, image_profile)
+
+
+def rag_extractor_key(embedding_model):
+    """Build the key function of a RAG extraction: the document, the embedding model and the retrieval settings."""
+    def key(pdf_hash, mode, image_profile):
+        return make_key(pdf_hash, embedding_model, RAG_CHUNK_SIZE, RAG_CHUNK_OVERLAP, RAG_TOP_K, RAG_QUERY_GROUP_BY,
+                        RAG_QUERY_GROUP_SIZE, RETRIEVER_BACKEND)
+    return key
+
+
+def document_key(pdf_hash, mode, image_profile):
+    return make_key(pdf_hash, mode, image_profile or DEFAULT_IMAGE_PROFILE)
+
+
+class Pipeline:
+    """
+    Extraction pipeline made of pluggable stages: an extractor (loader,
+    rasterizer/retriever and LLM call producing the document data), a chat model
+    for the template mapping, the token scheduler of that model's provider, and
+    the shared cache and output sink.
+
+    run() works in the calling thread; arun() is its asyncio version. An
+    extractor without an async_extractor counterpart (e.g. Chroma retrieval)
+    runs in the default executor under arun().
+    """
+
+    def __init__(self, name, extractor, chat_model_factory, model_name, async_extractor=None,
+                 scheduler=openai_scheduler, extractor_key=document_key):
+        self.name = name
+        self.extractor = extractor
+        # (pdf hash, mode, image profile) -> key of the document data the extractor produces with its settings.
+        self.extractor_key = extractor_key
+        self.chat_model_factory = chat_model_factory
+        self.model_name = model_name
+        self.async_extractor = async_extractor
+        self.scheduler = scheduler
+
+    def cache_key(self, pdf_hash, template, image_profile=None, mode=None):
+        """
+        Key of the cached template response of a document: the key of its extracted
+        data (document hash and extractor settings), the template and the mapping settings.
+        """
+        return make_key(self.name, self.extractor_key(pdf_hash, mode or EXTRACTION_MODE, image_profile),
+                        template["hash"], self.model_name, PROMPT_VERSION, MAPPING_GROUP_BY, MAPPING_GROUP_SIZE,
+                        MAPPING_REASK_ATTEMPTS)
+
+    def _prepare(self, file_path, submission_id, image_profile, mode, progress):
+        """Return (template, cache key, pdf hash, cached response or None)."""
+        pdf_hash = file_sha256(file_path)
+        template = template_store.get()
+        cache_key = self.cache_key(pdf_hash, template, image_profile, mode)
+        cached = extraction_cache.get(MAPPED, cache_key)
+        if cached is not None:
+            save_output(submission_id, "output.json", cached)
+            notify(progress, "cache_hit", stage=MAPPED)
+        return template, cache_key, pdf_hash, cached
+
+    def _store(self, submission_id, cache_key, parsed_response):
+        if parsed_response is None:
+            return None
+        save_output(submission_id, "output.json", parsed_response)
+        extraction_cache.set(MAPPED, cache_key, parsed_response)
+        return parsed_response
+
+    def _done(self, submission_id):
+        trace = current_trace()
+        if trace is not None:
+            save_output(submission_id, "timings.json", trace.summary())
+        print(f"{self.name}: process done")
+
+    def run(self, file_path, submission_id, image_profile=None, mode=None, progress=None):
+        mode = mode or EXTRACTION_MODE
+        template, cache_key, pdf_hash, cached = self._prepare(file_path, submission_id, image_profile, mode,
+                                                              progress)
+        if cached is not None:
+            return cached
+
+        try:
+            data = self.extractor(file_path, submission_id, image_profile=image_profile, pdf_hash=pdf_hash,
+                                  mode=mode, progress=progress)
+            if not data:
+                return None
+            parsed_response = map_to_template(data, template, self.chat_model_factory(), progress=progress,
+                                              scheduler=self.scheduler)
+            return self._store(submission_id, cache_key, parsed_response)
+        finally:
+            self._done(submission_id)
+
+    async def arun(self, file_path, submission_id, image_profile=None, mode=None, progress=None):
+        mode = mode or EXTRACTION_MODE
+        # Hashing the file, the cache lookups and the artifact writes block: they run off the event loop.
+        template, cache_key, pdf_hash, cached = await asyncio.to_thread(self._prepare, file_path, submission_id,
+                                                                        image_profile, mode, progress)
+        if cached is not None:
+            return cached
+
+        try:
+            options = {"image_profile": image_profile, "pdf_hash": pdf_hash, "mode": mode, "progress": progress}
+            if self.async_extractor is not None:
+                data = await self.async_extractor(file_path, submission_id, **options)
+            else:
+                data = await asyncio.to_thread(self.extractor, file_path, submission_id, **options)
+            if not data:
+                return None
+            parsed_response = await amap_to_template(data, template, self.chat_model_factory(), progress=progress,
+                                                     scheduler=self.scheduler)
+            return await asyncio.to_thread(self._store, submission_id, cache_key, parsed_response)
+        finally:
+            await asyncio.to_thread(self._done, submission_id)
+
+
+RAG_EMBEDDINGS = {
+    "openai-rag": lambda: openai_embeddings(openai_api_key),
+    "gemini-rag": lambda: gemini_embeddings(google_api_key),
+}
+PIPELINES = {
+    "openai-vision": Pipeline("openai-vision", extract_with_vision, openai_chat_model, MAPPING_MODEL,
+                              async_extractor=aextract_with_vision, extractor_key=vision_extractor_key),
+    "openai-rag": Pipeline("openai-rag", rag_extractor("openai", RAG_EMBEDDINGS["openai-rag"]),
+                           openai_chat_model, MAPPING_MODEL, extractor_key=rag_extractor_key(OPENAI_EMBEDDING_MODEL)),
+    "gemini-rag": Pipeline("gemini-rag", rag_extractor("gemini", RAG_EMBEDDINGS["gemini-rag"]),
+                           gemini_chat_model, GEMINI_MODEL, scheduler=gemini_scheduler,
+                           extractor_key=rag_extractor_key(GEMINI_EMBEDDING_MODEL)),
+}
+
+
+def warm_up(backend=None):
+    """Import the packages and create the shared clients of a backend ahead of its first request."""
+    backend = backend or DEFAULT_BACKEND
+    try:
+        PIPELINES[backend].chat_model_factory()
+        if backend in RAG_EMBEDDINGS:
+            import dataprocessing.rag  # noqa: F401
+            RAG_EMBEDDINGS[backend]()
+    except Exception as e:
+        print(f"Warm-up of {backend} failed: {e}")
+
+
+# Extractors replacing the backend's own for uploads that are not PDFs.
+CONTENT_EXTRACTORS = {IMAGE: fetch_image_insights, TEXT: extract_text_file}
+ASYNC_CONTENT_EXTRACTORS = {IMAGE: afetch_image_insights}
+CONTENT_EXTRACTOR_KEYS = {IMAGE: vision_extractor_key, TEXT: document_key}
+
+
+def pipeline_for(backend, content_type=PDF):
+    """
+    Return the pipeline for a backend and upload type. PDFs use the backend as
+    is; images skip rendering and go to the vision model, and text goes straight
+    to the backend's mapping model.
+    """
+    if backend not in PIPELINES:
+        raise ValueError(f"Unsupported backend: {backend}")
+    pipeline = PIPELINES[backend]
+    if content_type == PDF:
+        return pipeline
+    if content_type not in CONTENT_EXTRACTORS:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    return Pipeline(f"{backend}-{content_type}", CONTENT_EXTRACTORS[content_type], pipeline.chat_model_factory,
+                    pipeline.model_name, async_extractor=ASYNC_CONTENT_EXTRACTORS.get(content_type),
+                    scheduler=pipeline.scheduler, extractor_key=CONTENT_EXTRACTOR_KEYS[content_type])
+
+
+def run_pipeline(backend, file_path, submission_id, content_type=None, **options):
+    """Run the extraction pipeline of the given backend and return the template response, or None."""
+    return pipeline_for(backend, content_type or detect_content_type(file_path)).run(file_path, submission_id,
+                                                                                      **options)
+
+
+async def arun_pipeline(backend, file_path, submission_id, content_type=None, **options):
+    """asyncio version of run_pipeline; must run on the shared loop of async_runtime."""
+    pipeline = pipeline_for(backend, content_type or detect_content_type(file_path))
+    return await pipeline.arun(file_path, submission_id, **options)
+
+
+def run_batch(backend, file_paths, submission_id, concurrency=None, progress=None, filenames=None, **options):
+    """
+    Run the pipeline on every document of a submission, at most concurrency at a
+    time (capped at BATCH_CONCURRENCY), and merge their values into one template
+    response. Documents are given in priority order (e.g. application, loss runs,
+    supplements); each one writes its artifacts under
+    output/<submission_id>/documents/<index>/. filenames are the names the
+    documents are reported under (the uploaded ones), by default their file names.
+
+    Returns {"application_details", "sources", "documents"}, or None when no
+    document could be extracted.
+    """
+    template = template_store.get()
+    names = list(filenames) if filenames is not None else [os.path.basename(path) for path in file_paths]
+
+    def run_document(index):
+        document_progress = None
+        if progress is not None:
+            def document_progress(event, data):
+                progress(event, {"document": index, **data})
+        try:
+            response = run_pipeline(backend, file_paths[index], f"{submission_id}/documents/{index}",
+                                    progress=document_progress, **options)
+        except Exception as e:
+            print(f"Error processing {names[index]}: {e}")
+            response = None
+        notify(progress, "document_done", document=index, filename=names[index], ok=response is not None)
+        return response
+
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY, len(file_paths)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        responses = list(executor.map(bind(run_document), range(len(file_paths))))
+
+    documents = [{"index": index, "filename": name, "ok": response is not None}
+                 for index, (name, response) in enumerate(zip(names, responses))]
+    extracted = [(name, response_values(response)) for name, response in zip(names, responses)
+                 if response is not None]
+    if not extracted:
+        save_output(submission_id, "sources.json", {"documents": documents, "fields": {}})
+        return None
+    values, sources = merge_document_values(template["fields"], extracted)
+    merged = build_template_response(template["template"], values)
+    save_output(submission_id, "output.json", merged)
+    save_output(submission_id, "sources.json", {"documents": documents, "fields": sources})
+    return {"application_details": merged, "sources": sources, "documents": documents}
+
+
+def match_extracted_with_template(file_path, submission_id, image_profile=None, mode=None, progress=None,
+                                  backend=None):
+    return run_pipeline(backend or DEFAULT_BACKEND, file_path, submission_id, image_profile=image_profile,
+                        mode=mode, progress=progress)
@@ -0,0 +1,288 @@
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+from uuid import UUID
+
+from dotenv import load_dotenv
+
+from extraction_cache import file_sha256
+
+# Load environment variables
+load_dotenv()
+
+UPLOAD_FOLDER = "uploads"
+OUTPUT_FOLDER = "output"
+CHROMA_FOLDER = "chroma"
+# Content-addressed copies of the uploads; submission folders hold hard links to them.
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, "blobs")
+
+# Retention in seconds per artifact type (0 keeps them forever).
+STORAGE_UPLOAD_RETENTION = int(os.getenv("STORAGE_UPLOAD_RETENTION", str(24 * 3600)))
+STORAGE_OUTPUT_RETENTION = int(os.getenv("STORAGE_OUTPUT_RETENTION", str(7 * 24 * 3600)))
+STORAGE_CHROMA_RETENTION = int(os.getenv("STORAGE_CHROMA_RETENTION", str(24 * 3600)))
+# Seconds between sweeper passes (0 disables the background sweeper), files deleted and
+# submission folders or blobs visited per pass at most.
+STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))
+STORAGE_SWEEP_BATCH = int(os.getenv("STORAGE_SWEEP_BATCH", "500"))
+STORAGE_SWEEP_MAX_ENTRIES = int(os.getenv("STORAGE_SWEEP_MAX_ENTRIES", "2000"))
+STORAGE_STATS_PATH = os.getenv("STORAGE_STATS_PATH", os.path.join(OUTPUT_FOLDER, "cache", "storage_stats.json"))
+
+
+def store_upload(path):
+    """
+    Deduplicate a saved upload through the content-addressed blob store: the first
+    copy of some content is linked into the store, later identical uploads are
+    replaced by a hard link to it. Returns the blob path.
+    """
+    digest = file_sha256(path)
+    blob = os.path.join(BLOB_FOLDER, digest[:2], digest + os.path.splitext(path)[1].lower())
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    link = f"{path}.link"
+    try:
+        try:
+            os.link(blob, link)
+        except FileNotFoundError:
+            os.link(path, blob)
+            return blob
+        os.replace(link, path)
+        # The blob's mtime marks its last use for the retention of unreferenced blobs.
+        os.utime(blob)
+        return blob
+    except OSError as e:
+        print(f"Upload {path} kept outside the blob store: {e}")
+        return path
+
+
+def _is_submission(name):
+    try:
+        UUID(name)
+        return True
+    except ValueError:
+        return False
+
+
+def _tree_usage(path):
+    """Return (files, bytes) under a directory."""
+    files = size = 0
+    for folder, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(folder, name)).st_size
+                files += 1
+            except OSError:
+                pass
+    return files, size
+
+
+def _read_json(path):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, path)
+
+
+def disk_usage(path="."):
+    """Free and used space and inodes of the volume holding path."""
+    stat = os.statvfs(path)
+    return {
+        "total_bytes": stat.f_blocks * stat.f_frsize,
+        "free_bytes": stat.f_bavail * stat.f_frsize,
+        "total_inodes": stat.f_files,
+        "free_inodes": stat.f_favail,
+    }
+
+
+class StorageSweeper:
+    """
+    Background garbage collector of the submission folders in uploads/, output/
+    and chroma/ and of unreferenced upload blobs. Each pass visits at most
+    max_entries of them, where the previous pass stopped, and deletes at most
+    batch_size files. Passes of several processes are serialized with a file
+    lock, and a process skips its pass when another one swept within the interval.
+    """
+
+    def __init__(self, interval=STORAGE_SWEEP_INTERVAL, batch_size=STORAGE_SWEEP_BATCH,
+                 max_entries=STORAGE_SWEEP_MAX_ENTRIES, stats_path=STORAGE_STATS_PATH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self.stats_path = stats_path
+        self.roots = {
+            "uploads": (UPLOAD_FOLDER, STORAGE_UPLOAD_RETENTION),
+            "output": (OUTPUT_FOLDER, STORAGE_OUTPUT_RETENTION),
+            "chroma": (CHROMA_FOLDER, STORAGE_CHROMA_RETENTION),
+        }
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _listing(self):
+        """Return the (key, path) of every submission folder and blob, in sweep order; nothing is stat'ed."""
+        listing = []
+        for root, (path, _) in self.roots.items():
+            try:
+                names = sorted(name for name in os.listdir(path) if _is_submission(name))
+            except FileNotFoundError:
+                continue
+            listing.extend(((root, name), os.path.join(path, name)) for name in names)
+        try:
+            shards = sorted(os.listdir(BLOB_FOLDER))
+        except FileNotFoundError:
+            shards = []
+        for shard in shards:
+            try:
+                names = sorted(os.listdir(os.path.join(BLOB_FOLDER, shard)))
+            except OSError:
+                continue
+            listing.extend((("blobs", f"{shard}/{name}"), os.path.join(BLOB_FOLDER, shard, name)) for name in names)
+        return listing
+
+    def _scan(self, now, cursor, cached):
+        """
+        Visit at most max_entries entries, starting after the cursor of the last
+        pass. An entry expires on its top-level mtime; the files and bytes of a
+        folder are only measured again when that mtime changed. Returns the usage
+        per root, the expired paths (oldest first), the next cursor and the
+        usage of each entry.
+        """
+        listing = self._listing()
+        order = {root: rank for rank, root in enumerate([*self.roots, "blobs"])}
+        start = 0
+        if cursor:
+            cursor = (order.get(cursor[0], len(order)), cursor[1])
+            start = bisect.bisect_right([(order[root], name) for (root, name), _ in listing], cursor)
+        visited = (listing[start:] + listing[:start])[:self.max_entries]
+        next_cursor = list(visited[-1][0]) if len(visited) < len(listing) else None
+
+        entries = {f"{root}/{name}": cached[f"{root}/{name}"] for (root, name), _ in listing
+                   if f"{root}/{name}" in cached}
+        expired = []
+        for (root, name), path in visited:
+            key = f"{root}/{name}"
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                entries.pop(key, None)
+                continue
+            if root == "blobs":
+                entries[key] = [stat.st_mtime, 1, stat.st_size]
+                # A link count of 1 means no submission folder references the blob any more.
+                if stat.st_nlink == 1 and now - stat.st_mtime > STORAGE_UPLOAD_RETENTION:
+                    expired.append((stat.st_mtime, root, path))
+                continue
+            if key not in entries or entries[key][0] != stat.st_mtime:
+                entries[key] = [stat.st_mtime, *_tree_usage(path)]
+            retention = self.roots[root][1]
+            if retention and now - stat.st_mtime > retention:
+                expired.append((stat.st_mtime, root, path))
+
+        usage = {root: {"entries": 0, "files": 0, "bytes": 0, "expired": 0} for root in order}
+        for (root, name), _ in listing:
+            usage[root]["entries"] += 1
+            _, files, size = entries.get(f"{root}/{name}", (0, 0, 0))
+            usage[root]["files"] += files
+            usage[root]["bytes"] += size
+        for _, root, _ in expired:
+            usage[root]["expired"] += 1
+        expired.sort()
+        return usage, [path for _, _, path in expired], next_cursor, entries
+
+    def _delete(self, path, budget):
+        """Delete a file or folder bottom-up within the remaining budget; return the number of files deleted."""
+        if not os.path.isdir(path):
+            try:
+                os.remove(path)
+                return 1
+            except FileNotFoundError:
+                return 0
+        deleted = 0
+        for folder, subfolders, names in os.walk(path, topdown=False):
+            for name in names:
+                if deleted >= budget:
+                    return deleted
+                try:
+                    os.remove(os.path.join(folder, name))
+                    deleted += 1
+                except FileNotFoundError:
+                    pass
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+        return deleted
+
+    def sweep_once(self, force=False):
+        """
+        Run one pass; return its report, or None when another process is sweeping
+        or, unless forced, swept less than interval seconds ago.
+        """
+        os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+        with open(f"{self.stats_path}.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            started = time.time()
+            try:
+                last_sweep = os.stat(self.stats_path).st_mtime
+            except FileNotFoundError:
+                last_sweep = 0
+            # Every gunicorn worker runs a sweeper; one pass per interval is enough for all of them.
+            if not force and started - last_sweep < self.interval:
+                return None
+            state = _read_json(f"{self.stats_path}.entries")
+            usage, expired, cursor, entries = self._scan(started, state.get("cursor"), state.get("entries", {}))
+            deleted_files = deleted_entries = 0
+            for path in expired:
+                if deleted_files >= self.batch_size:
+                    break
+                deleted_files += self._delete(path, self.batch_size - deleted_files)
+                deleted_entries += 0 if os.path.exists(path) else 1
+            report = {
+                "updated_at": started,
+                "duration_seconds": round(time.time() - started, 3),
+                "roots": usage,
+                "deleted": {"entries": deleted_entries, "files": deleted_files},
+                "pending": len(expired) - deleted_entries,
+            }
+            _write_json(f"{self.stats_path}.entries", {"cursor": cursor, "entries": entries})
+            _write_json(self.stats_path, report)
+            return report
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """Start the background sweeper thread once per process (no-op when the interval is 0)."""
+        with self._lock:
+            if self.interval <= 0 or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        """Usage from the last sweeper pass (no tree walk on the request path) and live disk usage."""
+        return {"last_sweep": _read_json(self.stats_path), "disk": disk_usage(), "sweeper_running": self._thread is not None}
+
+
+storage_sweeper = StorageSweeper()
+
+
+if __name__ == '__main__':
+    # One pass from cron or by hand: python storage.py
+    print(json.dumps(storage_sweeper.sweep_once(force=True), indent=4))
@@ -0,0 +1,301 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+TEMPLATE_PATH = os.getenv("TEMPLATE_PATH", "sample/template/template.json")
+PLACEHOLDER = "<value>"
+# Template sections and the key holding the field id in each of them.
+SECTIONS = (("coverage_values", "coverage_parameter_id"), ("risk_values", "risk_parameter_id"))
+# Date formats accepted from the model; dates are normalized to ISO (YYYY-MM-DD).
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+DOMAIN_PATTERN = re.compile(r"^(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}$", re.IGNORECASE)
+
+
+def _has_placeholder(value):
+    if isinstance(value, dict):
+        return any(_has_placeholder(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_placeholder(item) for item in value)
+    return value == PLACEHOLDER
+
+
+def _blank(value):
+    """Replace every placeholder in a template value with an empty string."""
+    if isinstance(value, dict):
+        return {key: _blank(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_blank(item) for item in value]
+    return "" if value == PLACEHOLDER else value
+
+
+def template_fields(template):
+    """Flatten the template into one entry per field: id, label, type and shape/default value."""
+    fields = []
+    for section, id_key in SECTIONS:
+        for field in template.get(section, []):
+            field_id = field.get(id_key)
+            parameter_text = field.get("parameter_text") or {}
+            fields.append({
+                "section": section,
+                "id": field_id,
+                "label": parameter_text.get("agent_facing_text") or field_id.split("_", 2)[-1].replace("_", " "),
+                "type": field.get("input_type", "short_text"),
+                "value": field.get("value"),
+                "options": field.get("options"),
+            })
+    return fields
+
+
+def compact_schema(fields):
+    """Render the fields as 'id | label | type' lines, with the expected shape or default when there is one."""
+    lines = []
+    for field in fields:
+        line = f"{field['id']} | {field['label']} | {field['type']}"
+        if field["value"] != PLACEHOLDER:
+            hint = "shape" if _has_placeholder(field["value"]) else "default"
+            line += f" | {hint}: {json.dumps(_blank(field['value']))}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def field_family(field_id):
+    """Prefix family of a field id, e.g. 'cvg_o3mw_cyb_effective_date' -> 'cvg_cyb'."""
+    parts = field_id.split("_")
+    if len(parts) > 2 and parts[2] == "cyb":
+        return f"{parts[0]}_cyb"
+    return parts[0]
+
+
+def field_groups(fields, group_by="none", group_size=20):
+    """
+    Partition the fields for concurrent mapping calls. group_by is 'none' (one
+    group), 'count' (consecutive groups of group_size) or 'prefix' (one group per
+    id family, each split into groups of at most group_size).
+    """
+    if group_by == "none" or not fields:
+        return [list(fields)]
+    if group_by == "count":
+        families = [list(fields)]
+    elif group_by == "prefix":
+        by_family = {}
+        for field in fields:
+            by_family.setdefault(field_family(field["id"]), []).append(field)
+        families = list(by_family.values())
+    else:
+        raise ValueError(f"Unsupported field grouping: {group_by}")
+    return [family[start:start + group_size] for family in families for start in range(0, len(family), group_size)]
+
+
+def stitch_group_values(fields, groups, group_values):
+    """
+    Merge the id -> value maps returned for each group. Checks that every template
+    field belongs to exactly one group and drops ids a group was not asked for.
+    """
+    owners = {}
+    for index, group in enumerate(groups):
+        for field in group:
+            owners.setdefault(field["id"], []).append(index)
+    missing = [field["id"] for field in fields if field["id"] not in owners]
+    duplicated = [field_id for field_id, indexes in owners.items() if len(indexes) > 1]
+    if missing or duplicated:
+        raise ValueError(f"Field groups do not partition the template: missing={missing}, duplicated={duplicated}")
+
+    values = {}
+    for index, group_value in enumerate(group_values):
+        for field_id, value in (group_value or {}).items():
+            if owners.get(field_id) == [index]:
+                values[field_id] = value
+            else:
+                print(f"Ignoring field {field_id} returned by group {index}.")
+    return values
+
+
+def _number(value):
+    if isinstance(value, bool):
+        raise ValueError("expected a number")
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, str):
+        raise ValueError("expected a number")
+    text = value.strip().replace("$", "").replace(",", "").replace(" ", "")
+    try:
+        number = float(text)
+    except ValueError:
+        raise ValueError(f"{value!r} is not a number")
+    return int(number) if number.is_integer() else number
+
+
+def _scalar(value):
+    if isinstance(value, (dict, list)):
+        raise ValueError("expected a single value")
+    return value
+
+
+def validate_value(field, value):
+    """
+    Check a value returned by the model against the field's input_type; return it
+    normalized (ISO dates, numbers for amounts) or raise ValueError with the reason.
+    """
+    field_type = field["type"]
+    if field_type == "date":
+        if not isinstance(value, str):
+            raise ValueError("expected a date string")
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip(), date_format).date().isoformat()
+            except ValueError:
+                continue
+        raise ValueError(f"{value!r} is not a date (expected YYYY-MM-DD)")
+    if field_type in ("currency", "number"):
+        return _number(value)
+    if field_type == "integer":
+        number = _number(value)
+        if not float(number).is_integer():
+            raise ValueError(f"{value!r} is not a whole number")
+        return int(number)
+    if field_type == "select_one":
+        value = _scalar(value)
+        if field.get("options") and value not in field["options"]:
+            raise ValueError(f"{value!r} is not one of {field['options']}")
+        return value
+    if field_type == "select_many":
+        values = value if isinstance(value, list) else [value]
+        values = [_scalar(item) for item in values]
+        invalid = [item for item in values if field.get("options") and item not in field["options"]]
+        if invalid:
+            raise ValueError(f"{invalid!r} are not among {field['options']}")
+        return values
+    if field_type == "email":
+        if not isinstance(value, str) or not EMAIL_PATTERN.match(value.strip()):
+            raise ValueError(f"{value!r} is not an email address")
+        return value.strip()
+    if field_type == "phone":
+        digits = re.sub(r"\D", "", str(_scalar(value)))
+        if not 7 <= len(digits) <= 15:
+            raise ValueError(f"{value!r} is not a phone number")
+        return value
+    if field_type == "domain":
+        if not isinstance(value, str):
+            raise ValueError("expected a domain name")
+        domain = re.sub(r"^[a-z]+://", "", value.strip(), flags=re.IGNORECASE).split("/")[0]
+        if not DOMAIN_PATTERN.match(domain):
+            raise ValueError(f"{value!r} is not a domain name")
+        return domain.lower()
+    if field_type == "address":
+        if not isinstance(value, dict):
+            raise ValueError("expected an address object")
+        if isinstance(field["value"], dict):
+            unknown = set(value) - set(field["value"])
+            if unknown:
+                raise ValueError(f"unexpected address keys {sorted(unknown)}")
+        return value
+    return _scalar(value)
+
+
+def validate_values(fields, values):
+    """
+    Validate an id -> value map against the fields; return the normalized valid
+    values and an id -> reason map of the rejected ones. Empty values are skipped.
+    """
+    valid = {}
+    failures = {}
+    for field in fields:
+        value = values.get(field["id"])
+        if value in (None, "", [], {}):
+            continue
+        try:
+            valid[field["id"]] = validate_value(field, value)
+        except ValueError as e:
+            failures[field["id"]] = str(e)
+    return valid, failures
+
+
+def build_template_response(template, values):
+    """
+    Rebuild the full template response from an id -> value map. Fields missing
+    from the map keep their template default, with placeholders left blank.
+    """
+    response = copy.deepcopy(template)
+    for section, id_key in SECTIONS:
+        for field in response.get(section, []):
+            value = values.get(field.get(id_key))
+            if value is None or value == "":
+                field["value"] = _blank(field.get("value"))
+            else:
+                field["value"] = value
+    return response
+
+
+def response_values(response):
+    """Return the id -> value map of a template response."""
+    values = {}
+    for section, id_key in SECTIONS:
+        for field in response.get(section, []):
+            values[field.get(id_key)] = field.get("value")
+    return values
+
+
+def merge_document_values(fields, documents):
+    """
+    Merge the id -> value maps extracted from the documents of one submission.
+
+    documents is a list of (name, values) in priority order; for each field the
+    first document holding a value other than the blank template default wins.
+    Returns the merged values and, per field, the source document and the
+    differing values found in the other documents.
+    """
+    values = {}
+    sources = {}
+    for field in fields:
+        default = _blank(field["value"])
+        for name, document_values in documents:
+            value = document_values.get(field["id"])
+            if value in (None, "", [], {}) or value == default:
+                continue
+            if field["id"] not in values:
+                values[field["id"]] = value
+                sources[field["id"]] = {"document": name, "alternatives": []}
+            elif value != values[field["id"]]:
+                sources[field["id"]]["alternatives"].append({"document": name, "value": value})
+    return values, sources
+
+
+class TemplateStore:
+    """Parsed template kept in memory and reloaded when the file's mtime changes."""
+
+    def __init__(self, path=TEMPLATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._snapshot = None
+
+    def get(self):
+        """Return a dict with the parsed template, its hash, flattened fields and compact schema."""
+        mtime = os.stat(self.path).st_mtime_ns
+        with self._lock:
+            if self._snapshot is None or mtime != self._mtime:
+                with open(self.path, "rb") as file:
+                    raw = file.read()
+                template = json.loads(raw)
+                fields = template_fields(template)
+                self._snapshot = {
+                    "template": template,
+                    "hash": hashlib.sha256(raw).hexdigest(),
+                    "fields": fields,
+                    "schema": compact_schema(fields),
+                }
+                self._mtime = mtime
+            return self._snapshot
+
+
+template_store = TemplateStore()
@@ -0,0 +1,58 @@
+import os
+
+from dotenv import load_dotenv
+from pypdf import PdfReader
+
+# Load environment variables
+load_dotenv()
+
+# auto: send pages with a usable text layer as text and rasterize the rest,
+# text: never rasterize, vision: always rasterize.
+EXTRACTION_MODES = {"auto", "text", "vision"}
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "auto").lower()
+TEXT_MIN_CHARS = int(os.getenv("TEXT_MIN_CHARS", "200"))
+TEXT_MIN_QUALITY = float(os.getenv("TEXT_MIN_QUALITY", "0.7"))
+
+
+def extract_page_texts(pdf_path):
+    """Return the text layer of every PDF page ('' for pages without one)."""
+    reader = PdfReader(pdf_path)
+    texts = []
+    for page in reader.pages:
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception as e:
+            print(f"Error extracting text layer: {e}")
+            texts.append("")
+    return texts
+
+
+def text_quality(text):
+    """Share of non-blank characters that are letters, digits or common punctuation."""
+    characters = [character for character in text if not character.isspace()]
+    if not characters:
+        return 0.0
+    readable = sum(character.isalnum() or character in ".,:;/$%()-'\"#&@!?" for character in characters)
+    return readable / len(characters)
+
+
+def has_usable_text(text, min_chars=TEXT_MIN_CHARS, min_quality=TEXT_MIN_QUALITY):
+    """True when a page's text layer is dense and clean enough to replace its image."""
+    stripped = text.strip()
+    return len(stripped) >= min_chars and text_quality(stripped) >= min_quality
+
+
+def classify_pages(pdf_path, mode=EXTRACTION_MODE):
+    """
+    Return one (page_number, text) tuple per page, where text is None for pages
+    that need to be rasterized. Only meaningful for the auto and text modes.
+    """
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unsupported extraction mode: {mode}")
+    pages = []
+    for page_number, text in enumerate(extract_page_texts(pdf_path), start=1):
+        if mode == "text" or has_usable_text(text):
+            pages.append((page_number, text))
+        else:
+            pages.append((page_number, None))
+    return pages
@@ -0,0 +1,95 @@
+import codecs
+import os
+
+from dotenv import load_dotenv
+from PIL import Image
+from pypdf import PdfReader
+
+# Load environment variables
+load_dotenv()
+
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "50"))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "200"))
+# Bytes read from the start of an upload to identify its type.
+SNIFF_BYTES = 8192
+
+PDF = "pdf"
+IMAGE = "image"
+TEXT = "text"
+EXTENSION_TYPES = {"pdf": PDF, "png": IMAGE, "jpg": IMAGE, "jpeg": IMAGE, "gif": IMAGE, "txt": TEXT}
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff", b"GIF87a", b"GIF89a")
+
+
+class InvalidUploadError(ValueError):
+    """Raised when an upload is rejected; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_content_type(head):
+    """Identify pdf, image or text content from the first bytes of a file, or return None."""
+    # The PDF header may be preceded by junk bytes, readers accept it within the first 1 KB.
+    if b"%PDF-" in head[:1024]:
+        return PDF
+    if head.startswith(IMAGE_SIGNATURES):
+        return IMAGE
+    if head and b"\x00" not in head:
+        try:
+            # Incremental decode: a multi-byte character may be cut at the end of the head.
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            return TEXT
+        except UnicodeDecodeError:
+            return None
+    return None
+
+
+def detect_content_type(path):
+    with open(path, "rb") as file:
+        return sniff_content_type(file.read(SNIFF_BYTES))
+
+
+def check_upload_head(filename, head):
+    """Return the content type of an upload from its name and first bytes, or raise InvalidUploadError."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in EXTENSION_TYPES:
+        raise InvalidUploadError("Invalid file type", status=415)
+    content_type = sniff_content_type(head)
+    if content_type is None:
+        raise InvalidUploadError(f"Unrecognized content for a .{extension} file", status=415)
+    if content_type != EXTENSION_TYPES[extension]:
+        raise InvalidUploadError(f"File content ({content_type}) does not match its .{extension} extension",
+                                 status=415)
+    return content_type
+
+
+def validate_document(path, content_type):
+    """Check that a stored upload can be processed (readable, within the page cap), or raise InvalidUploadError."""
+    if content_type == PDF:
+        try:
+            reader = PdfReader(path)
+            if reader.is_encrypted and not reader.decrypt(""):
+                raise InvalidUploadError("Encrypted PDFs are not supported")
+            pages = len(reader.pages)
+        except InvalidUploadError:
+            raise
+        except Exception as e:
+            raise InvalidUploadError(f"Unreadable PDF: {e}")
+        if pages == 0:
+            raise InvalidUploadError("The PDF has no pages")
+        if pages > MAX_PDF_PAGES:
+            raise InvalidUploadError(f"The PDF has {pages} pages, at most {MAX_PDF_PAGES} are accepted", status=413)
+    elif content_type == IMAGE:
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except Exception as e:
+            raise InvalidUploadError(f"Unreadable image: {e}")
+    elif content_type == TEXT:
+        try:
+            with open(path, encoding="utf-8") as text_file:
+                if not text_file.read().strip():
+                    raise InvalidUploadError("The text file is empty")
+        except UnicodeDecodeError:
+            raise InvalidUploadError("Text files must be UTF-8 encoded", status=415)